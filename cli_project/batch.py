@@ -0,0 +1,299 @@
+"""Answers a file of queries without the interactive prompt.
+
+    python batch.py queries.jsonl --output results.jsonl --concurrency 8
+
+Each input line is a JSON object with a "query" (anything you could type
+at the prompt, including "/command doc_id" and @mentions) and an optional
+"id". Every query runs in its own conversation; all of them share the MCP
+servers. A result line is appended to the output as soon as its query
+finishes, and rerunning with the same output skips queries that already
+succeeded, so an interrupted run can simply be restarted.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from contextlib import AsyncExitStack
+from dataclasses import asdict
+from typing import IO, Callable, Optional
+
+from core.claude import Claude
+from core.cli_chat import CliChat
+from core.tools import ToolManager
+from core.tracing import tracer
+from main import (
+    claude_model,
+    connect_clients,
+    create_clients,
+    create_compactor,
+)
+
+
+class RateLimiter:
+    """Token bucket allowing `per_minute` acquisitions a minute, in bursts
+    of up to `burst`. Waiters are served in arrival order."""
+
+    def __init__(self, per_minute: float, burst: int = 1):
+        if not 0 < per_minute < float("inf") or burst < 1:
+            raise ValueError("RateLimiter needs per_minute > 0 and burst >= 1")
+        self.interval = 60.0 / per_minute
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated) / self.interval,
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) * self.interval)
+
+
+def load_queries(path: str) -> list[dict]:
+    queries = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"query": item}
+            item.setdefault("id", line_number)
+            queries.append(item)
+    return queries
+
+
+def completed_ids(path: str) -> set:
+    """Ids that already have a successful result in the output file."""
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by a crash
+                continue
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+def open_output(path: str) -> IO[str]:
+    output = open(path, "a+", encoding="utf-8")
+    if output.tell():
+        output.seek(output.tell() - 1)
+        if output.read(1) != "\n":
+            # Terminate a line cut short by a crash before appending
+            output.write("\n")
+    return output
+
+
+class BatchRunner:
+    def __init__(
+        self,
+        doc_client,
+        clients: dict,
+        claude_service: Claude,
+        output: IO[str],
+        concurrency: int = 4,
+        rate_limiter: Optional[RateLimiter] = None,
+    ):
+        self.doc_client = doc_client
+        self.clients = clients
+        self.claude_service = claude_service
+        self.output = output
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter
+        self.tool_manager = ToolManager(clients)
+        self.succeeded = 0
+        self.failed = 0
+
+    async def run_query(self, item: dict) -> dict:
+        chat = CliChat(
+            doc_client=self.doc_client,
+            clients=self.clients,
+            claude_service=self.claude_service,
+            compactor=create_compactor(),
+            tool_manager=self.tool_manager,
+        )
+        record = {"id": item["id"], "query": item["query"]}
+        start = time.perf_counter()
+        try:
+            record["response"] = await chat.run(
+                item["query"], on_text=lambda _: None
+            )
+            record["status"] = "ok"
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["latency_s"] = round(time.perf_counter() - start, 3)
+
+        stats = chat.last_turn_stats
+        if stats:
+            record["time_to_first_token_s"] = (
+                round(stats.time_to_first_token, 3)
+                if stats.time_to_first_token is not None
+                else None
+            )
+            record["model_calls"] = stats.model_calls
+            record["usage"] = asdict(stats.usage)
+        return record
+
+    def write(self, record: dict):
+        self.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.output.flush()
+        if record["status"] == "ok":
+            self.succeeded += 1
+        else:
+            self.failed += 1
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if self.rate_limiter:
+                await self.rate_limiter.acquire()
+            self.write(await self.run_query(item))
+
+    async def run(self, queries: list[dict]):
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in queries:
+            queue.put_nowait(item)
+        await asyncio.gather(
+            *(self._worker(queue) for _ in range(self.concurrency))
+        )
+
+
+def positive(parse: Callable[[str], float]) -> Callable[[str], float]:
+    """An argparse type accepting only finite values above zero."""
+
+    def parse_positive(text: str):
+        try:
+            value = parse(text)
+        except ValueError:
+            value = 0
+        if not 0 < value < float("inf"):
+            raise argparse.ArgumentTypeError(f"must be above 0, not {text!r}")
+        return value
+
+    return parse_positive
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("queries", help="JSONL file of queries")
+    parser.add_argument(
+        "--output", required=True, help="JSONL file results are appended to"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=positive(int),
+        default=4,
+        help="Queries answered at the same time",
+    )
+    parser.add_argument(
+        "--rate",
+        type=positive(float),
+        help="Start at most this many queries per minute",
+    )
+    parser.add_argument(
+        "--burst",
+        type=positive(int),
+        default=1,
+        help="Queries that may start back to back under --rate",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep MCP servers running between launches (see mcp_daemon.py)",
+    )
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="Host the document server in this process",
+    )
+    parser.add_argument("--trace", metavar="FILE")
+    parser.add_argument("--connect-timeout", type=float, default=30.0)
+    parser.add_argument(
+        "server_scripts",
+        nargs="*",
+        help="Additional MCP server scripts to connect to",
+    )
+    return parser.parse_args()
+
+
+async def main():
+    cli_args = parse_args()
+    if cli_args.trace:
+        tracer.configure(cli_args.trace)
+
+    done = completed_ids(cli_args.output)
+    queries = [
+        item for item in load_queries(cli_args.queries) if item["id"] not in done
+    ]
+    if done:
+        print(
+            f"Skipping {len(done)} queries already answered in "
+            f"{cli_args.output}",
+            file=sys.stderr,
+        )
+
+    claude_service = Claude(model=claude_model)
+    async with AsyncExitStack() as stack:
+        clients = await connect_clients(
+            create_clients(
+                cli_args.server_scripts,
+                daemon=cli_args.daemon,
+                in_process=cli_args.in_process,
+            ),
+            stack,
+            timeout=cli_args.connect_timeout,
+        )
+        if "doc_client" not in clients:
+            print("Error: the document server failed to start.")
+            return
+
+        output = stack.enter_context(open_output(cli_args.output))
+        runner = BatchRunner(
+            doc_client=clients["doc_client"],
+            clients=clients,
+            claude_service=claude_service,
+            output=output,
+            concurrency=cli_args.concurrency,
+            rate_limiter=RateLimiter(cli_args.rate, cli_args.burst)
+            if cli_args.rate is not None
+            else None,
+        )
+        start = time.perf_counter()
+        await runner.run(queries)
+
+    usage = claude_service.cache_stats
+    print(
+        f"{runner.succeeded} succeeded, {runner.failed} failed in "
+        f"{time.perf_counter() - start:.1f}s | input tokens "
+        f"{usage.input_tokens} | output tokens {usage.output_tokens} | "
+        f"cache hit ratio {usage.cache_hit_ratio:.0%}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+    asyncio.run(main())
@@ -0,0 +1,248 @@
+"""Measures the overhead the agent loop adds on top of the model and tools.
+
+Drives Chat.run against a scripted, in-process Messages API and an
+in-process MCP server, for every combination of tool fan-out (tool
+calls per model response) and history length (prior messages sent with
+each request):
+
+    python -m benchmarks.agent_loop --fanout 1,8 --history 0,200
+    python -m benchmarks.agent_loop --save-baseline
+    python -m benchmarks.agent_loop          # fails on regression
+
+Overhead is the wall time of a turn minus the time the fake API spent
+building its responses. Allocation peaks are measured in a separate
+pass with tracemalloc, since tracing slows everything down.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+from core.chat import Chat
+from core.claude import Claude
+from trace_report import percentile
+from mcp_client import MCPClient
+from benchmarks.fakes import ScriptedMessagesAPI, make_fake_server
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Metrics compared against the baseline; lower is better for all of them
+METRICS = ("overhead_p50_ms", "alloc_peak_kb", "request_bytes")
+
+
+def make_history(length: int) -> list[dict]:
+    history = []
+    for i in range(length // 2):
+        history.append(
+            {"role": "user", "content": f"Question {i} about the report?"}
+        )
+        history.append(
+            {"role": "assistant", "content": f"Answer {i}. " + "text " * 40}
+        )
+    return history
+
+
+async def run_scenario(
+    fanout: int,
+    history: int,
+    turns: int,
+    warmup: int,
+    payload_bytes: int,
+    measure_allocations: bool,
+) -> dict:
+    api = ScriptedMessagesAPI(fanout)
+    claude = Claude(model="bench")
+    claude.client, claude.async_client = api.clients()
+    base_messages = make_history(history)
+
+    server = make_fake_server(payload_bytes)
+    async with MCPClient(command="", args=[], server=server) as client:
+        chat = Chat(claude_service=claude, clients={"bench": client})
+
+        async def turn() -> tuple[float, int]:
+            # Every turn starts from the same history, so turns compare
+            chat.messages = list(base_messages)
+            handler_before = api.handler_seconds
+            bytes_before = api.request_bytes
+            start = time.perf_counter()
+            await chat.run("What does the report say?", on_text=lambda _: None)
+            elapsed = time.perf_counter() - start
+            overhead = elapsed - (api.handler_seconds - handler_before)
+            return overhead, api.request_bytes - bytes_before
+
+        for _ in range(warmup):
+            await turn()
+
+        overheads = []
+        request_bytes = 0
+        requests_before = api.requests
+        for _ in range(turns):
+            overhead, sent = await turn()
+            overheads.append(overhead * 1000)
+            request_bytes = sent
+        model_calls = (api.requests - requests_before) / turns
+
+        alloc_peaks = []
+        if measure_allocations:
+            tracemalloc.start()
+            try:
+                for _ in range(turns):
+                    tracemalloc.reset_peak()
+                    before, _ = tracemalloc.get_traced_memory()
+                    await turn()
+                    _, peak = tracemalloc.get_traced_memory()
+                    alloc_peaks.append((peak - before) / 1024)
+            finally:
+                tracemalloc.stop()
+
+    return {
+        "fanout": fanout,
+        "history": history,
+        "overhead_p50_ms": percentile(overheads, 50),
+        "overhead_p90_ms": percentile(overheads, 90),
+        "alloc_peak_kb": statistics.median(alloc_peaks)
+        if alloc_peaks
+        else None,
+        "request_bytes": request_bytes,
+        "model_calls": model_calls,
+    }
+
+
+def scenario_key(result: dict) -> str:
+    return f"fanout={result['fanout']},history={result['history']}"
+
+
+def format_results(results: list[dict]) -> str:
+    rows = [
+        f"{'scenario':<24}{'calls':>6}{'p50 ms':>9}{'p90 ms':>9}"
+        f"{'alloc kB':>10}{'sent kB':>9}"
+    ]
+    for result in results:
+        alloc = result["alloc_peak_kb"]
+        rows.append(
+            f"{scenario_key(result):<24}{result['model_calls']:>6.1f}"
+            f"{result['overhead_p50_ms']:>9.2f}"
+            f"{result['overhead_p90_ms']:>9.2f}"
+            f"{alloc if alloc is not None else float('nan'):>10.1f}"
+            f"{result['request_bytes'] / 1024:>9.1f}"
+        )
+    return "\n".join(rows)
+
+
+def find_regressions(
+    results: list[dict], baseline: dict, threshold: float
+) -> list[str]:
+    regressions = []
+    for result in results:
+        expected = baseline.get(scenario_key(result))
+        if not expected:
+            continue
+        for metric in METRICS:
+            value, limit = result.get(metric), expected.get(metric)
+            if value is None or not limit:
+                continue
+            if value > limit * (1 + threshold):
+                regressions.append(
+                    f"{scenario_key(result)} {metric}: {value:.2f}"
+                    f" vs baseline {limit:.2f} (+{value / limit - 1:.0%})"
+                )
+    return regressions
+
+
+def parse_counts(value: str) -> list[int]:
+    return [int(part) for part in value.split(",") if part]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--fanout",
+        type=parse_counts,
+        default=[0, 1, 8],
+        help="Comma-separated tool calls per model response",
+    )
+    parser.add_argument(
+        "--history",
+        type=parse_counts,
+        default=[0, 200],
+        help="Comma-separated numbers of prior messages",
+    )
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument(
+        "--payload-bytes",
+        type=int,
+        default=2048,
+        help="Size of each tool result",
+    )
+    parser.add_argument(
+        "--no-allocations",
+        action="store_true",
+        help="Skip the tracemalloc pass",
+    )
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Write the results as the new baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Allowed relative increase over the baseline",
+    )
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for fanout in args.fanout:
+        for history in args.history:
+            results.append(
+                await run_scenario(
+                    fanout,
+                    history,
+                    turns=args.turns,
+                    warmup=args.warmup,
+                    payload_bytes=args.payload_bytes,
+                    measure_allocations=not args.no_allocations,
+                )
+            )
+
+    print(format_results(results))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(
+                {scenario_key(result): result for result in results},
+                f,
+                indent=2,
+            )
+        print(f"\nSaved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = find_regressions(results, baseline, args.threshold)
+    if regressions:
+        print(f"\nRegressions beyond {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print("\nNo regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,181 @@
+"""Deterministic stand-ins for the Anthropic API and an MCP server.
+
+Both run in-process, so a benchmark measures the agent loop itself
+rather than the network or a subprocess.
+"""
+
+import json
+import time
+
+import httpx
+from anthropic import Anthropic, AsyncAnthropic
+from mcp.server.fastmcp import FastMCP
+
+USAGE = {
+    "input_tokens": 100,
+    "output_tokens": 1,
+    "cache_creation_input_tokens": 0,
+    "cache_read_input_tokens": 0,
+}
+
+
+def _sse(events: list[dict]) -> bytes:
+    return "".join(
+        f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        for event in events
+    ).encode()
+
+
+def _message_events(blocks: list[dict], stop_reason: str) -> list[dict]:
+    events = [
+        {
+            "type": "message_start",
+            "message": {
+                "id": "msg_bench",
+                "type": "message",
+                "role": "assistant",
+                "model": "bench",
+                "content": [],
+                "stop_reason": None,
+                "stop_sequence": None,
+                "usage": USAGE,
+            },
+        }
+    ]
+    for index, block in enumerate(blocks):
+        if block["type"] == "text":
+            events.append(
+                {
+                    "type": "content_block_start",
+                    "index": index,
+                    "content_block": {"type": "text", "text": ""},
+                }
+            )
+            for word in block["text"].split(" "):
+                events.append(
+                    {
+                        "type": "content_block_delta",
+                        "index": index,
+                        "delta": {"type": "text_delta", "text": word + " "},
+                    }
+                )
+        else:
+            events.append(
+                {
+                    "type": "content_block_start",
+                    "index": index,
+                    "content_block": {**block, "input": {}},
+                }
+            )
+            events.append(
+                {
+                    "type": "content_block_delta",
+                    "index": index,
+                    "delta": {
+                        "type": "input_json_delta",
+                        "partial_json": json.dumps(block["input"]),
+                    },
+                }
+            )
+        events.append({"type": "content_block_stop", "index": index})
+    events.append(
+        {
+            "type": "message_delta",
+            "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+            "usage": {"output_tokens": 20},
+        }
+    )
+    events.append({"type": "message_stop"})
+    return events
+
+
+class ScriptedMessagesAPI:
+    """Replays a fixed tool-use conversation for the Messages API.
+
+    A request whose last message is a user query gets `fanout` lookup
+    tool calls back; one answering those tool calls gets a final text
+    reply. The reply depends only on the request, so any number of
+    turns can be replayed. Request bytes and the time spent in here are
+    recorded so callers can subtract it from what they measure.
+    """
+
+    def __init__(self, fanout: int, reply_words: int = 40):
+        self.fanout = fanout
+        self.reply = " ".join(["word"] * reply_words)
+        self.requests = 0
+        self.request_bytes = 0
+        self.handler_seconds = 0.0
+
+    def _respond(self, body: dict) -> tuple[list[dict], str]:
+        last = body["messages"][-1]["content"]
+        answering_tools = isinstance(last, list) and any(
+            block.get("type") == "tool_result" for block in last
+        )
+        if answering_tools or not self.fanout:
+            return [{"type": "text", "text": self.reply}], "end_turn"
+
+        turn = self.requests
+        blocks = [{"type": "text", "text": "Looking that up."}]
+        for i in range(self.fanout):
+            blocks.append(
+                {
+                    "type": "tool_use",
+                    "id": f"toolu_{turn}_{i}",
+                    "name": "lookup",
+                    "input": {"key": f"{turn}-{i}"},
+                }
+            )
+        return blocks, "tool_use"
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        self.requests += 1
+        self.request_bytes += len(request.content)
+        body = json.loads(request.content)
+        blocks, stop_reason = self._respond(body)
+        if body.get("stream"):
+            response = httpx.Response(
+                200,
+                content=_sse(_message_events(blocks, stop_reason)),
+                headers={"content-type": "text/event-stream"},
+            )
+        else:
+            response = httpx.Response(
+                200,
+                json={
+                    "id": "msg_bench",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": "bench",
+                    "content": blocks,
+                    "stop_reason": stop_reason,
+                    "stop_sequence": None,
+                    "usage": USAGE,
+                },
+            )
+        self.handler_seconds += time.perf_counter() - start
+        return response
+
+    def clients(self) -> tuple[Anthropic, AsyncAnthropic]:
+        transport = httpx.MockTransport(self.handle)
+        return (
+            Anthropic(
+                api_key="benchmark",
+                http_client=httpx.Client(transport=transport),
+            ),
+            AsyncAnthropic(
+                api_key="benchmark",
+                http_client=httpx.AsyncClient(transport=transport),
+            ),
+        )
+
+
+def make_fake_server(payload_bytes: int) -> FastMCP:
+    mcp = FastMCP("BenchMCP", log_level="ERROR")
+    filler = "x" * payload_bytes
+
+    @mcp.tool(description="Returns a fixed-size record for a key.")
+    def lookup(key: str) -> str:
+        return f"{key}:{filler}"
+
+    return mcp
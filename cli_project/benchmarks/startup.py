@@ -0,0 +1,81 @@
+"""Measures time to the first prompt of main.py.
+
+    python -m benchmarks.startup --runs 5
+
+Runs `main.py --profile-startup` repeatedly for each transport and
+reports the time it measures to the first prompt, along with the wall
+time of the whole process (interpreter start and shutdown included).
+Dummy credentials are used; nothing is sent to the API.
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+from trace_report import percentile
+
+READY = re.compile(r"time to first prompt\s+([\d.]+)")
+TRANSPORTS = {"stdio": [], "in-process": ["--in-process"]}
+
+
+def run_once(flags: list[str], env: dict) -> tuple[float, float]:
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "main.py", "--profile-startup", "--no-journal"]
+        + flags,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    match = READY.search(result.stdout)
+    if not match:
+        raise RuntimeError(f"No startup profile in output:\n{result.stdout}")
+    return float(match.group(1)), wall_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--transports",
+        default=",".join(TRANSPORTS),
+        help="Comma-separated subset of: " + ", ".join(TRANSPORTS),
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = {
+            **os.environ,
+            "CLAUDE_MODEL": os.getenv("CLAUDE_MODEL") or "benchmark",
+            "ANTHROPIC_API_KEY": os.getenv("ANTHROPIC_API_KEY")
+            or "benchmark",
+            "SESSION_DIR": directory,
+        }
+        print(
+            f"{'transport':<16}{'first prompt p50':>18}{'min':>10}"
+            f"{'process p50':>14}"
+        )
+        for transport in args.transports.split(","):
+            # One unmeasured run so every run sees warm file caches
+            run_once(TRANSPORTS[transport], env)
+            ready, wall = zip(
+                *(
+                    run_once(TRANSPORTS[transport], env)
+                    for _ in range(args.runs)
+                )
+            )
+            print(
+                f"{transport:<16}{percentile(ready, 50):>15.0f} ms"
+                f"{min(ready):>7.0f} ms{percentile(wall, 50):>11.0f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Compares the stdio and in-process transports to DocumentMCP.
+
+    python -m benchmarks.transport --sizes 1000,100000,1000000
+
+Both transports serve the same SQLite document store, seeded with one
+document per size. Reports connect time and read_doc_contents latency.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from document_store import SQLiteDocumentStore
+from mcp_client import MCPClient
+from trace_report import percentile
+
+
+def seed_store(path: str, sizes: list[int]) -> list[str]:
+    store = SQLiteDocumentStore(path)
+    doc_ids = []
+    for size in sizes:
+        doc_id = f"bench_{size}.txt"
+        line = "The condenser tower report covers inspections and repairs.\n"
+        store.put(doc_id, (line * (size // len(line) + 1))[:size])
+        doc_ids.append(doc_id)
+    store.close()
+    return doc_ids
+
+
+def make_client(transport: str, store_path: str) -> MCPClient:
+    if transport == "in-process":
+        from mcp_server import mcp as server
+
+        return MCPClient(command="", args=[], server=server)
+    return MCPClient(
+        command=sys.executable,
+        args=["mcp_server.py"],
+        env={"DOC_STORE_PATH": store_path},
+    )
+
+
+async def bench_transport(
+    transport: str, store_path: str, doc_ids: list[str], iterations: int
+) -> dict:
+    connects = []
+    for _ in range(3):
+        client = make_client(transport, store_path)
+        start = time.perf_counter()
+        await client.connect()
+        connects.append((time.perf_counter() - start) * 1000)
+        await client.cleanup()
+
+    reads = {}
+    async with make_client(transport, store_path) as client:
+        for doc_id in doc_ids:
+            timings = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                await client.call_tool("read_doc_contents", {"doc_id": doc_id})
+                timings.append((time.perf_counter() - start) * 1000)
+            reads[doc_id] = percentile(timings, 50)
+    return {"connect_ms": percentile(connects, 50), "read_ms": reads}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default="1000,100000,1000000",
+        help="Comma-separated document sizes in characters",
+    )
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    with tempfile.TemporaryDirectory() as directory:
+        store_path = os.path.join(directory, "bench.db")
+        doc_ids = seed_store(store_path, sizes)
+        # The in-process server reads the store path when imported
+        os.environ["DOC_STORE_PATH"] = store_path
+
+        results = {
+            transport: await bench_transport(
+                transport, store_path, doc_ids, args.iterations
+            )
+            for transport in ("stdio", "in-process")
+        }
+
+    stdio, in_process = results["stdio"], results["in-process"]
+    print(f"{'':<28}{'stdio ms':>12}{'in-process ms':>16}{'speedup':>10}")
+    rows = [("connect", stdio["connect_ms"], in_process["connect_ms"])]
+    for doc_id, size in zip(doc_ids, sizes):
+        rows.append(
+            (
+                f"read {size} chars",
+                stdio["read_ms"][doc_id],
+                in_process["read_ms"][doc_id],
+            )
+        )
+    for label, slow, fast in rows:
+        print(f"{label:<28}{slow:>12.2f}{fast:>16.2f}{slow / fast:>9.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,14 +1,90 @@
-from core.claude import Claude
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, Optional
+from core.claude import CacheStats, Claude
 from mcp_client import MCPClient
 from core.tools import ToolManager
-from anthropic.types import MessageParam
+from core.compaction import ConversationCompactor, render_transcript
+from core.journal import SessionJournal
+from core.metrics import metrics
+from core.tracing import payload_size, tracer
+
+if TYPE_CHECKING:
+    from anthropic.types import Message, MessageParam
+
+
+@dataclass
+class TurnStats:
+    time_to_first_token: Optional[float] = None
+    total_latency: float = 0.0
+    model_calls: int = 0
+    usage: CacheStats = field(default_factory=CacheStats)
+
+    def summary(self) -> str:
+        ttft = (
+            f"{self.time_to_first_token:.2f}s"
+            if self.time_to_first_token is not None
+            else "n/a"
+        )
+        return (
+            f"ttft {ttft} | total {self.total_latency:.2f}s"
+            f" | model calls {self.model_calls}"
+        )
+
+
+SUMMARY_PROMPT = """
+Summarize the following conversation between a user and an assistant so
+that it can replace the original messages. Keep every fact, decision,
+document id and open question the assistant may need later. Be concise.
+
+<conversation>
+{transcript}
+</conversation>
+"""
 
 
 class Chat:
-    def __init__(self, claude_service: Claude, clients: dict[str, MCPClient]):
+    def __init__(
+        self,
+        claude_service: Claude,
+        clients: dict[str, MCPClient],
+        compactor: Optional[ConversationCompactor] = None,
+        tool_manager: Optional[ToolManager] = None,
+        journal: Optional[SessionJournal] = None,
+    ):
         self.claude_service: Claude = claude_service
         self.clients: dict[str, MCPClient] = clients
         self.messages: list[MessageParam] = []
+        # Chats may share a ToolManager, and with it the per-server
+        # concurrency limits and per-document edit locks.
+        self.tool_manager = tool_manager or ToolManager(clients)
+        self.last_turn_stats: Optional[TurnStats] = None
+        self.compactor = compactor
+        if compactor and compactor.summarizer is None:
+            compactor.summarizer = self.summarize_messages
+        self.journal = journal
+
+    def _record(self, rewritten: bool = False):
+        """Journals new messages, or the whole list once it was rewritten."""
+        if not self.journal:
+            return
+        if rewritten:
+            self.journal.snapshot(self.messages)
+        else:
+            self.journal.append(self.messages)
+
+    async def summarize_messages(self, messages: list[MessageParam]) -> str:
+        prompt = SUMMARY_PROMPT.format(transcript=render_transcript(messages))
+        summary = ""
+        async for event in self.claude_service.stream_chat(
+            messages=[{"role": "user", "content": prompt}]
+        ):
+            if event.type == "message":
+                summary = self.claude_service.text_from_message(event.message)
+        return summary
 
     async def _process_query(self, query: str):
         self.messages.append({"role": "user", "content": query})
@@ -16,32 +92,100 @@ class Chat:
     async def run(
         self,
         query: str,
+        on_text: Optional[Callable[[str], None]] = None,
     ) -> str:
-        final_text_response = ""
+        with tracer.span("chat.run", query_bytes=payload_size(query)) as span:
+            final_text_response = ""
+            stats = TurnStats()
+            turn_start = time.perf_counter()
 
-        await self._process_query(query)
+            with tracer.span("chat.process_query"):
+                await self._process_query(query)
+            self._record()
 
-        while True:
-            response = self.claude_service.chat(
-                messages=self.messages,
-                tools=await ToolManager.get_all_tools(self.clients),
-            )
+            while True:
+                response: Optional[Message] = None
+                started_tools: list[asyncio.Task] = []
+                stats.model_calls += 1
 
-            self.claude_service.add_assistant_message(self.messages, response)
+                if self.compactor and await self.compactor.maybe_compact(
+                    self.messages
+                ):
+                    self._record(rewritten=True)
 
-            if response.stop_reason == "tool_use":
-                print(self.claude_service.text_from_message(response))
-                tool_result_parts = await ToolManager.execute_tool_requests(
-                    self.clients, response
-                )
+                try:
+                    async for event in self.claude_service.stream_chat(
+                        messages=self.messages,
+                        tools=await self.tool_manager.get_all_tools(),
+                    ):
+                        if event.type == "text":
+                            if stats.time_to_first_token is None:
+                                stats.time_to_first_token = (
+                                    time.perf_counter() - turn_start
+                                )
+                            if on_text:
+                                on_text(event.text)
+                        elif (
+                            event.type == "tool_use"
+                            and self.tool_manager.concurrent
+                        ):
+                            started_tools.append(
+                                self.tool_manager.start_tool_request(event.block)
+                            )
+                        elif event.type == "message":
+                            response = event.message
+                except BaseException:
+                    for task in started_tools:
+                        task.cancel()
+                    raise
 
-                self.claude_service.add_user_message(
-                    self.messages, tool_result_parts
-                )
-            else:
-                final_text_response = self.claude_service.text_from_message(
-                    response
-                )
-                break
+                stats.usage.record(response.usage)
+                self.claude_service.add_assistant_message(self.messages, response)
 
-        return final_text_response
+                if response.stop_reason == "tool_use":
+                    if not on_text:
+                        print(self.claude_service.text_from_message(response))
+                    with tracer.span("chat.wait_for_tools"):
+                        if started_tools:
+                            tool_result_parts = list(
+                                await asyncio.gather(*started_tools)
+                            )
+                        else:
+                            tool_result_parts = (
+                                await self.tool_manager.execute_tool_requests(
+                                    response
+                                )
+                            )
+
+                    self.claude_service.add_user_message(
+                        self.messages, tool_result_parts
+                    )
+                    # Journaled with its tool calls, so a crash while the
+                    # tools run never leaves calls without results
+                    self._record()
+                else:
+                    for task in started_tools:
+                        task.cancel()
+                    self._record()
+                    final_text_response = (
+                        self.claude_service.text_from_message(response)
+                    )
+                    break
+
+            stats.total_latency = time.perf_counter() - turn_start
+            self.last_turn_stats = stats
+            metrics.histogram(
+                "chat_turn_seconds", "Query to final answer"
+            ).observe(stats.total_latency)
+            if stats.time_to_first_token is not None:
+                metrics.histogram(
+                    "chat_ttft_seconds", "Query to the first text shown"
+                ).observe(stats.time_to_first_token)
+            span.set(
+                model_calls=stats.model_calls,
+                ttft_ms=stats.time_to_first_token * 1000
+                if stats.time_to_first_token is not None
+                else None,
+                messages=len(self.messages),
+            )
+            return final_text_response
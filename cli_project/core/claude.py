@@ -1,28 +1,124 @@
-from anthropic import Anthropic
-from anthropic.types import Message
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, AsyncIterator, Literal, Optional
+from core.metrics import metrics
+from core.tracing import payload_size, tracer
+
+if TYPE_CHECKING:
+    # anthropic takes about half a second to import; it is loaded when
+    # the first client is created instead.
+    from anthropic import Anthropic, AsyncAnthropic
+    from anthropic.types import Message, ToolUseBlock, Usage
+
+# The API accepts at most four cache_control breakpoints per request.
+MAX_CACHE_BREAKPOINTS = 4
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+@dataclass
+class StreamEvent:
+    """One item yielded by Claude.stream_chat.
+
+    "text" carries a text delta, "tool_use" a fully received tool_use
+    block, and "message" the final Message once the stream has ended.
+    """
+
+    type: Literal["text", "tool_use", "message"]
+    text: str = ""
+    block: Optional[ToolUseBlock] = None
+    message: Optional[Message] = None
+
+
+@dataclass
+class CacheStats:
+    """Token usage accumulated over every request of a session."""
+
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+
+    def record(self, usage: Usage):
+        self.requests += 1
+        self.input_tokens += usage.input_tokens or 0
+        self.output_tokens += usage.output_tokens or 0
+        self.cache_creation_input_tokens += (
+            usage.cache_creation_input_tokens or 0
+        )
+        self.cache_read_input_tokens += usage.cache_read_input_tokens or 0
+
+    @property
+    def cache_hit_ratio(self) -> float:
+        total = (
+            self.input_tokens
+            + self.cache_creation_input_tokens
+            + self.cache_read_input_tokens
+        )
+        return self.cache_read_input_tokens / total if total else 0.0
+
+
+def _content(message):
+    from anthropic.types import Message
+
+    return message.content if isinstance(message, Message) else message
+
+
+def _with_cache_control(block):
+    block = dict(block) if isinstance(block, dict) else block.model_dump(
+        exclude_none=True
+    )
+    block["cache_control"] = CACHE_CONTROL
+    return block
 
 
 class Claude:
-    def __init__(self, model: str):
-        self.client = Anthropic()
+    def __init__(
+        self,
+        model: str,
+        prompt_caching: bool = True,
+        price_per_mtok: Optional[tuple[float, float]] = None,
+    ):
+        self._client: Optional[Anthropic] = None
+        self._async_client: Optional[AsyncAnthropic] = None
         self.model = model
+        self.prompt_caching = prompt_caching
+        self.cache_stats = CacheStats()
+        # USD per million input and output tokens, for the cost metric
+        self.price_per_mtok = price_per_mtok
+
+    @property
+    def client(self) -> Anthropic:
+        if self._client is None:
+            from anthropic import Anthropic
+
+            self._client = Anthropic()
+        return self._client
+
+    @client.setter
+    def client(self, client: Anthropic):
+        self._client = client
+
+    @property
+    def async_client(self) -> AsyncAnthropic:
+        if self._async_client is None:
+            from anthropic import AsyncAnthropic
+
+            self._async_client = AsyncAnthropic()
+        return self._async_client
+
+    @async_client.setter
+    def async_client(self, client: AsyncAnthropic):
+        self._async_client = client
 
     def add_user_message(self, messages: list, message):
-        user_message = {
-            "role": "user",
-            "content": message.content
-            if isinstance(message, Message)
-            else message,
-        }
+        user_message = {"role": "user", "content": _content(message)}
         messages.append(user_message)
 
     def add_assistant_message(self, messages: list, message):
-        assistant_message = {
-            "role": "assistant",
-            "content": message.content
-            if isinstance(message, Message)
-            else message,
-        }
+        assistant_message = {"role": "assistant", "content": _content(message)}
         messages.append(assistant_message)
 
     def text_from_message(self, message: Message):
@@ -30,7 +126,7 @@ class Claude:
             [block.text for block in message.content if block.type == "text"]
         )
 
-    def chat(
+    def _build_params(
         self,
         messages,
         system=None,
@@ -39,7 +135,7 @@ class Claude:
         tools=None,
         thinking=False,
         thinking_budget=1024,
-    ) -> Message:
+    ) -> dict:
         params = {
             "model": self.model,
             "max_tokens": 8000,
@@ -60,5 +156,201 @@ class Claude:
         if system:
             params["system"] = system
 
-        message = self.client.messages.create(**params)
+        if self.prompt_caching:
+            self._add_cache_breakpoints(params)
+
+        return params
+
+    def _add_cache_breakpoints(self, params: dict):
+        """Marks the tools, the system prompt and the conversation prefix
+        as cacheable.
+
+        Works on copies so the caller's tools and messages are never
+        mutated. The remaining breakpoints roll forward over the most
+        recent user messages, so each request reads the prefix written by
+        the previous one and extends it.
+        """
+        budget = MAX_CACHE_BREAKPOINTS
+
+        if params.get("tools"):
+            tools = list(params["tools"])
+            tools[-1] = _with_cache_control(tools[-1])
+            params["tools"] = tools
+            budget -= 1
+
+        system = params.get("system")
+        if system:
+            if isinstance(system, str):
+                system = [{"type": "text", "text": system}]
+            system = list(system)
+            system[-1] = _with_cache_control(system[-1])
+            params["system"] = system
+            budget -= 1
+
+        messages = list(params["messages"])
+        for i in range(len(messages) - 1, -1, -1):
+            if budget == 0:
+                break
+            message = messages[i]
+            if message["role"] != "user" or not message["content"]:
+                continue
+
+            content = message["content"]
+            if isinstance(content, str):
+                content = [{"type": "text", "text": content}]
+            content = list(content)
+            content[-1] = _with_cache_control(content[-1])
+            messages[i] = {**message, "content": content}
+            budget -= 1
+        params["messages"] = messages
+
+    def chat(
+        self,
+        messages,
+        system=None,
+        temperature=1.0,
+        stop_sequences=[],
+        tools=None,
+        thinking=False,
+        thinking_budget=1024,
+    ) -> Message:
+        params = self._build_params(
+            messages,
+            system=system,
+            temperature=temperature,
+            stop_sequences=stop_sequences,
+            tools=tools,
+            thinking=thinking,
+            thinking_budget=thinking_budget,
+        )
+
+        with tracer.span("claude.chat", model=self.model) as span:
+            if span.recording:
+                span.set(request_bytes=payload_size(params))
+            started = time.perf_counter()
+            try:
+                message = self.client.messages.create(**params)
+            except Exception as e:
+                self._record_error(e)
+                raise
+            self.cache_stats.record(message.usage)
+            self._record_metrics(message, time.perf_counter() - started)
+            self._trace_usage(span, message)
         return message
+
+    def _record_error(self, error: Exception):
+        metrics.counter(
+            "claude_errors_total", "Failed Messages API requests"
+        ).inc(model=self.model, error=type(error).__name__)
+
+    def _record_metrics(
+        self, message: Message, seconds: float, ttft: Optional[float] = None
+    ):
+        usage = message.usage
+        metrics.counter(
+            "claude_requests_total", "Messages API requests"
+        ).inc(model=self.model)
+        metrics.histogram(
+            "claude_request_seconds", "Messages API request latency"
+        ).observe(seconds, model=self.model)
+        if ttft is not None:
+            metrics.histogram(
+                "claude_ttft_seconds", "Time to the first streamed text"
+            ).observe(ttft, model=self.model)
+
+        tokens = {
+            "input": usage.input_tokens or 0,
+            "output": usage.output_tokens or 0,
+            "cache_read": usage.cache_read_input_tokens or 0,
+            "cache_creation": usage.cache_creation_input_tokens or 0,
+        }
+        counter = metrics.counter("claude_tokens_total", "Tokens by type")
+        for kind, count in tokens.items():
+            counter.inc(count, model=self.model, type=kind)
+
+        if self.price_per_mtok:
+            input_price, output_price = self.price_per_mtok
+            # Cache writes cost 1.25x the input price, cache reads 0.1x
+            cost = (
+                tokens["input"]
+                + 1.25 * tokens["cache_creation"]
+                + 0.1 * tokens["cache_read"]
+            ) * input_price + tokens["output"] * output_price
+            metrics.counter(
+                "claude_cost_usd_total", "Estimated cost in USD"
+            ).inc(cost / 1_000_000, model=self.model)
+
+    def _trace_usage(self, span, message: Message):
+        if not span.recording:
+            return
+        usage = message.usage
+        span.set(
+            stop_reason=message.stop_reason,
+            input_tokens=usage.input_tokens,
+            output_tokens=usage.output_tokens,
+            cache_read_input_tokens=usage.cache_read_input_tokens,
+            cache_creation_input_tokens=usage.cache_creation_input_tokens,
+            response_bytes=payload_size(message),
+        )
+
+    async def stream_chat(
+        self,
+        messages,
+        system=None,
+        temperature=1.0,
+        stop_sequences=[],
+        tools=None,
+        thinking=False,
+        thinking_budget=1024,
+    ) -> AsyncIterator[StreamEvent]:
+        """Streams a response without blocking the event loop.
+
+        Text deltas are yielded as they arrive and each tool_use block as
+        soon as it is complete, so callers can render output and start
+        tools before the message has finished. The last event is always
+        the final "message".
+        """
+        params = self._build_params(
+            messages,
+            system=system,
+            temperature=temperature,
+            stop_sequences=stop_sequences,
+            tools=tools,
+            thinking=thinking,
+            thinking_budget=thinking_budget,
+        )
+
+        with tracer.span(
+            "claude.stream_chat", activate=False, model=self.model
+        ) as span:
+            if span.recording:
+                span.set(request_bytes=payload_size(params))
+            started = time.perf_counter()
+            ttft = None
+            try:
+                async with self.async_client.messages.stream(
+                    **params
+                ) as stream:
+                    async for event in stream:
+                        if event.type == "text":
+                            if ttft is None:
+                                ttft = time.perf_counter() - started
+                                span.set(ttft_ms=ttft * 1000)
+                            yield StreamEvent(type="text", text=event.text)
+                        elif (
+                            event.type == "content_block_stop"
+                            and event.content_block.type == "tool_use"
+                        ):
+                            yield StreamEvent(
+                                type="tool_use", block=event.content_block
+                            )
+
+                    message = await stream.get_final_message()
+            except Exception as e:
+                self._record_error(e)
+                raise
+
+            self.cache_stats.record(message.usage)
+            self._record_metrics(message, time.perf_counter() - started, ttft)
+            self._trace_usage(span, message)
+        yield StreamEvent(type="message", message=message)
@@ -1,4 +1,5 @@
-from typing import List, Optional
+import asyncio
+from typing import Awaitable, Callable, List, Optional
 from prompt_toolkit import PromptSession
 from prompt_toolkit.completion import Completer, Completion
 from prompt_toolkit.key_binding import KeyBindings
@@ -7,8 +8,16 @@ from prompt_toolkit.history import InMemoryHistory
 from prompt_toolkit.auto_suggest import AutoSuggest, Suggestion
 from prompt_toolkit.document import Document
 from prompt_toolkit.buffer import Buffer
+from mcp import types
 
 from core.cli_chat import CliChat
+from core.completion import CompletionIndex
+from core.metrics import metrics
+
+# Handled by the CLI itself rather than sent to the server as a prompt
+LOCAL_COMMANDS = [
+    types.Prompt(name="stats", description="Show session metrics"),
+]
 
 
 class CommandAutoSuggest(AutoSuggest):
@@ -31,24 +40,46 @@ class CommandAutoSuggest(AutoSuggest):
 
             if cmd in self.prompt_dict:
                 prompt = self.prompt_dict[cmd]
-                return Suggestion(f" {prompt.arguments[0].name}")
+                if prompt.arguments:
+                    return Suggestion(f" {prompt.arguments[0].name}")
 
         return None
 
 
 class UnifiedCompleter(Completer):
-    def __init__(self):
+    def __init__(self, page_size: int = 50):
+        self.page_size = page_size
         self.prompts = []
         self.prompt_dict = {}
         self.resources = []
+        self._prompt_index = CompletionIndex([])
+        self._resource_index = CompletionIndex([])
 
     def update_prompts(self, prompts: List):
         self.prompts = prompts
         self.prompt_dict = {prompt.name: prompt for prompt in prompts}
+        self._prompt_index = CompletionIndex(self.prompt_dict)
+
+    def __contains__(self, resource_id: str) -> bool:
+        return resource_id in self._resource_index
 
     def update_resources(self, resources: List):
+        # Completion runs in a thread; swap in the new index only once
+        # it is fully built.
+        self._resource_index = CompletionIndex(resources)
         self.resources = resources
 
+    def _resource_completions(self, prefix: str, display_meta=None):
+        for resource_id in self._resource_index.search(
+            prefix, self.page_size
+        ):
+            yield Completion(
+                resource_id,
+                start_position=-len(prefix),
+                display=resource_id,
+                display_meta=display_meta,
+            )
+
     def get_completions(self, document, complete_event):
         text = document.text
         text_before_cursor = document.text_before_cursor
@@ -56,15 +87,7 @@ class UnifiedCompleter(Completer):
         if "@" in text_before_cursor:
             last_at_pos = text_before_cursor.rfind("@")
             prefix = text_before_cursor[last_at_pos + 1 :]
-
-            for resource_id in self.resources:
-                if resource_id.lower().startswith(prefix.lower()):
-                    yield Completion(
-                        resource_id,
-                        start_position=-len(prefix),
-                        display=resource_id,
-                        display_meta="Resource",
-                    )
+            yield from self._resource_completions(prefix, "Resource")
             return
 
         if text.startswith("/"):
@@ -73,40 +96,27 @@ class UnifiedCompleter(Completer):
             if len(parts) <= 1 and not text.endswith(" "):
                 cmd_prefix = parts[0] if parts else ""
 
-                for prompt in self.prompts:
-                    if prompt.name.startswith(cmd_prefix):
-                        yield Completion(
-                            prompt.name,
-                            start_position=-len(cmd_prefix),
-                            display=f"/{prompt.name}",
-                            display_meta=prompt.description or "",
-                        )
+                for name in self._prompt_index.search(
+                    cmd_prefix, self.page_size
+                ):
+                    prompt = self.prompt_dict[name]
+                    yield Completion(
+                        prompt.name,
+                        start_position=-len(cmd_prefix),
+                        display=f"/{prompt.name}",
+                        display_meta=prompt.description or "",
+                    )
                 return
 
             if len(parts) == 1 and text.endswith(" "):
                 cmd = parts[0]
 
-                if cmd in self.prompt_dict:
-                    for id in self.resources:
-                        yield Completion(
-                            id,
-                            start_position=0,
-                            display=id,
-                        )
+                if cmd in self.prompt_dict and self.prompt_dict[cmd].arguments:
+                    yield from self._resource_completions("")
                 return
 
             if len(parts) >= 2:
-                doc_prefix = parts[-1]
-
-                for resource in self.resources:
-                    if "id" in resource and resource["id"].lower().startswith(
-                        doc_prefix.lower()
-                    ):
-                        yield Completion(
-                            resource["id"],
-                            start_position=-len(doc_prefix),
-                            display=resource["id"],
-                        )
+                yield from self._resource_completions(parts[-1])
                 return
 
 
@@ -115,6 +125,8 @@ class CliApp:
         self.agent = agent
         self.resources = []
         self.prompts = []
+        self._refresh_tasks: dict[str, asyncio.Task] = {}
+        self._stale_indexes: set[str] = set()
 
         self.completer = UnifiedCompleter()
 
@@ -175,36 +187,97 @@ class CliApp:
             complete_in_thread=True,
             auto_suggest=self.command_autosuggester,
         )
+        self.session.default_buffer.on_text_changed += self._prefetch_mentions
 
     async def initialize(self):
         await self.refresh_resources()
         await self.refresh_prompts()
+        self.agent.doc_client.add_notification_handler(self._on_notification)
+
+    def _prefetch_mentions(self, buffer: Buffer):
+        """Starts fetching every complete @doc_id in the buffer, including
+        ones just inserted by accepting a completion."""
+        for word in buffer.text.split():
+            if word.startswith("@") and word[1:] in self.completer:
+                self.agent.prefetcher.prefetch(word[1:])
+
+    async def _on_notification(self, notification):
+        if isinstance(notification, types.ResourceUpdatedNotification):
+            doc_id = str(notification.params.uri).rsplit("/", 1)[-1]
+            self.agent.document_changed(doc_id)
+        elif isinstance(notification, types.ResourceListChangedNotification):
+            self._schedule_refresh(self.refresh_resources)
+        elif isinstance(notification, types.PromptListChangedNotification):
+            self._schedule_refresh(self.refresh_prompts)
+
+    def _schedule_refresh(self, refresh: Callable[[], Awaitable[None]]):
+        """Runs refresh in the background so the prompt never waits on it.
+
+        Notifications arriving while a refresh runs cause one more run
+        once it finishes, not one run each.
+        """
+        name = refresh.__name__
+        if name in self._refresh_tasks:
+            self._stale_indexes.add(name)
+            return
+        self._refresh_tasks[name] = asyncio.create_task(
+            self._run_refresh(name, refresh)
+        )
+
+    async def _run_refresh(self, name: str, refresh):
+        try:
+            while True:
+                self._stale_indexes.discard(name)
+                await refresh()
+                if name not in self._stale_indexes:
+                    return
+        finally:
+            del self._refresh_tasks[name]
 
     async def refresh_resources(self):
         try:
             self.resources = await self.agent.list_docs_ids()
-            self.completer.update_resources(self.resources)
+            # Indexing tens of thousands of ids takes a moment; keep it
+            # off the event loop.
+            await asyncio.to_thread(
+                self.completer.update_resources, self.resources
+            )
         except Exception as e:
             print(f"Error refreshing resources: {e}")
 
     async def refresh_prompts(self):
         try:
-            self.prompts = await self.agent.list_prompts()
+            self.prompts = await self.agent.list_prompts() + LOCAL_COMMANDS
             self.completer.update_prompts(self.prompts)
             self.command_autosuggester = CommandAutoSuggest(self.prompts)
             self.session.auto_suggest = self.command_autosuggester
         except Exception as e:
             print(f"Error refreshing prompts: {e}")
 
+    def _render_text(self, text: str):
+        print(text, end="", flush=True)
+
     async def run(self):
         while True:
             try:
                 user_input = await self.session.prompt_async("> ")
                 if not user_input.strip():
                     continue
+                if user_input.strip() == "/stats":
+                    print(metrics.summary())
+                    continue
 
-                response = await self.agent.run(user_input)
-                print(f"\nResponse:\n{response}")
+                print("\nResponse:")
+                try:
+                    await self.agent.run(user_input, on_text=self._render_text)
+                finally:
+                    metrics.export()
+                print()
+                if self.agent.last_turn_stats:
+                    print(f"[{self.agent.last_turn_stats.summary()}]")
 
             except KeyboardInterrupt:
                 break
+
+        if self.agent.prefetcher.started:
+            print(f"[{self.agent.prefetcher.summary()}]")
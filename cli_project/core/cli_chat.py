@@ -1,11 +1,32 @@
-from typing import List, Tuple
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, List, Optional
 from mcp.types import Prompt, PromptMessage
-from anthropic.types import MessageParam
 
 from core.chat import Chat
 from core.claude import Claude
+from core.compaction import (
+    CHARS_PER_TOKEN,
+    UNCHANGED_DOCUMENT,
+    ConversationCompactor,
+)
+from core.journal import SessionJournal
+from core.prefetch import Prefetcher
+from core.retrieval import ChunkIndex
+from core.tools import ToolManager
+from core.tracing import tracer
 from mcp_client import MCPClient
 
+if TYPE_CHECKING:
+    from anthropic.types import MessageParam
+
+# Documents fetched and indexed per step of background indexing
+INDEX_BATCH_DOCS = 16
+# How long a query waits for indexing to catch up before searching
+# whatever is indexed so far
+INDEX_WAIT_SECONDS = 1.0
+
 
 class CliChat(Chat):
     def __init__(
@@ -13,10 +34,35 @@ class CliChat(Chat):
         doc_client: MCPClient,
         clients: dict[str, MCPClient],
         claude_service: Claude,
+        compactor: Optional[ConversationCompactor] = None,
+        tool_manager: Optional[ToolManager] = None,
+        journal: Optional[SessionJournal] = None,
+        retrieval: Optional[ChunkIndex] = None,
+        retrieval_budget_tokens: int = 2000,
+        retrieval_top_k: int = 8,
     ):
-        super().__init__(clients=clients, claude_service=claude_service)
+        super().__init__(
+            clients=clients,
+            claude_service=claude_service,
+            compactor=compactor,
+            tool_manager=tool_manager,
+            journal=journal,
+        )
 
         self.doc_client: MCPClient = doc_client
+        # Filled by the CLI while the user types @mentions
+        self.prefetcher = Prefetcher(self.get_doc_content)
+        # Excerpts of unmentioned documents relevant to each query
+        self.retrieval = retrieval
+        self.retrieval_budget_tokens = retrieval_budget_tokens
+        self.retrieval_top_k = retrieval_top_k
+        self._changed_docs: set[str] = set()
+        self._indexing: Optional[asyncio.Task] = None
+
+    def document_changed(self, doc_id: str):
+        """Called when the server reports doc_id was edited."""
+        self.prefetcher.invalidate(doc_id)
+        self._changed_docs.add(doc_id)
 
     async def list_prompts(self) -> list[Prompt]:
         return await self.doc_client.list_prompts()
@@ -32,21 +78,119 @@ class CliChat(Chat):
     ) -> list[PromptMessage]:
         return await self.doc_client.get_prompt(command, {"doc_id": doc_id})
 
+    def _in_conversation(self, text: str) -> bool:
+        for message in self.messages:
+            content = message["content"]
+            if isinstance(content, str):
+                if text in content:
+                    return True
+                continue
+            for block in content:
+                if isinstance(block, dict) and text in block.get("text", ""):
+                    return True
+        return False
+
     async def _extract_resources(self, query: str) -> str:
+        with tracer.span("cli_chat.extract_resources") as span:
+            added_resources = await self._fetch_mentioned_docs(query)
+            self.prefetcher.discard_unused()
+            if self.retrieval is not None:
+                added_resources += await self._retrieve_excerpts(query)
+            span.set(context_bytes=len(added_resources.encode()))
+            return added_resources
+
+    async def _fetch_mentioned_docs(self, query: str) -> str:
         mentions = [word[1:] for word in query.split() if word.startswith("@")]
+        if not mentions:
+            return ""
 
         doc_ids = await self.list_docs_ids()
-        mentioned_docs: list[Tuple[str, str]] = []
+        mentioned_ids = [doc_id for doc_id in doc_ids if doc_id in mentions]
+        contents = await asyncio.gather(
+            *(self._mentioned_doc_content(doc_id) for doc_id in mentioned_ids)
+        )
 
-        for doc_id in doc_ids:
-            if doc_id in mentions:
-                content = await self.get_doc_content(doc_id)
-                mentioned_docs.append((doc_id, content))
+        mentioned_docs: list[str] = []
+        for doc_id, content in zip(mentioned_ids, contents):
+            document = f'\n<document id="{doc_id}">\n{content}\n</document>\n'
+            if self._in_conversation(document):
+                # Unchanged since it was last shown; don't resend it
+                document = f"\n{UNCHANGED_DOCUMENT.format(doc_id=doc_id)}\n"
+            mentioned_docs.append(document)
 
-        return "".join(
-            f'\n<document id="{doc_id}">\n{content}\n</document>\n'
-            for doc_id, content in mentioned_docs
-        )
+        return "".join(mentioned_docs)
+
+    def start_indexing(self):
+        """Starts indexing new and changed documents in the background,
+        unless that is already under way."""
+        if self.retrieval is None:
+            return
+        if self._indexing is None or self._indexing.done():
+            self._indexing = asyncio.create_task(self._index_documents())
+
+    async def _index_documents(self):
+        """Indexes new and changed documents a batch at a time, so a large
+        corpus is fetched and embedded gradually, and drops deleted ones."""
+        try:
+            while True:
+                doc_ids = await self.list_docs_ids()
+                for doc_id in set(self.retrieval.doc_ids) - set(doc_ids):
+                    self.retrieval.remove(doc_id)
+                pending = [
+                    doc_id
+                    for doc_id in doc_ids
+                    if doc_id not in self.retrieval
+                    or doc_id in self._changed_docs
+                ][:INDEX_BATCH_DOCS]
+                if not pending:
+                    return
+                # A change reported while this batch is fetched re-adds it
+                self._changed_docs.difference_update(pending)
+                contents = await asyncio.gather(
+                    *(self.get_doc_content(doc_id) for doc_id in pending)
+                )
+
+                def index():
+                    for doc_id, content in zip(pending, contents):
+                        self.retrieval.update(doc_id, content)
+
+                # Embedding takes a while; keep it off the loop
+                await asyncio.to_thread(index)
+        except Exception as e:
+            print(f"Error indexing documents: {e}")
+
+    async def _retrieve_excerpts(self, query: str) -> str:
+        with tracer.span("cli_chat.retrieve") as span:
+            self.start_indexing()
+            await asyncio.wait({self._indexing}, timeout=INDEX_WAIT_SECONDS)
+            span.set(indexed=self._indexing.done())
+
+            mentions = {word[1:] for word in query.split() if word[:1] == "@"}
+            excerpts: list[str] = []
+            budget = self.retrieval_budget_tokens
+            for _, chunk in self.retrieval.search(query, self.retrieval_top_k):
+                tokens = len(chunk.text) // CHARS_PER_TOKEN + 1
+                if chunk.doc_id in mentions or tokens > budget:
+                    continue
+                if self._in_conversation(chunk.text):
+                    continue
+                budget -= tokens
+                excerpts.append(
+                    f'\n<document id="{chunk.doc_id}"'
+                    f' excerpt="characters {chunk.start}-{chunk.end}">'
+                    f"\n{chunk.text}\n</document>\n"
+                )
+            span.set(
+                excerpts=len(excerpts),
+                tokens=self.retrieval_budget_tokens - budget,
+            )
+            return "".join(excerpts)
+
+    async def _mentioned_doc_content(self, doc_id: str) -> str:
+        content = await self.prefetcher.take(doc_id)
+        if content is None:
+            content = await self.get_doc_content(doc_id)
+        return content
 
     async def _process_command(self, query: str) -> bool:
         if not query.startswith("/"):
@@ -82,6 +226,7 @@ class CliChat(Chat):
         Note the user's query might contain references to documents like "@report.docx". The "@" is only
         included as a way of mentioning the doc. The actual name of the document would be "report.docx".
         If the document content is included in this prompt, you don't need to use an additional tool to read the document.
+        A document with an "excerpt" attribute is only the part of it that looked relevant; read the document if you need the rest.
         Answer the user's question directly and concisely. Start with the exact information they need. 
         Don't refer to or mention the provided context in any way - just use it to inform your answer.
         """
@@ -0,0 +1,386 @@
+from __future__ import annotations
+
+import json
+import re
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+
+if TYPE_CHECKING:
+    from anthropic.types import MessageParam
+
+# Rough chars-per-token ratio; good enough to decide when to compact.
+CHARS_PER_TOKEN = 4
+
+DOCUMENT_PATTERN = re.compile(
+    r'<document id="(?P<id>[^"]*)">\n(?P<body>.*?)\n</document>', re.DOTALL
+)
+
+# Sent in place of a mentioned document already shown, unchanged, earlier
+UNCHANGED_DOCUMENT = (
+    '<document id="{doc_id}">[Unchanged; see the copy earlier in this '
+    "conversation.]</document>"
+)
+UNCHANGED_PATTERN = re.compile(
+    re.escape(UNCHANGED_DOCUMENT).replace(
+        re.escape("{doc_id}"), '(?P<id>[^"]*)'
+    )
+)
+
+Summarizer = Callable[[list["MessageParam"]], Awaitable[str]]
+
+
+def _field(block: Any, name: str, default=None):
+    if isinstance(block, dict):
+        return block.get(name, default)
+    return getattr(block, name, default)
+
+
+def _content_text(content: Any) -> str:
+    """Flattens message or tool_result content into plain text."""
+    if content is None:
+        return ""
+    if isinstance(content, str):
+        return content
+
+    parts = []
+    for block in content:
+        block_type = _field(block, "type")
+        if block_type == "text":
+            parts.append(_field(block, "text", ""))
+        elif block_type == "tool_use":
+            parts.append(_field(block, "name", ""))
+            parts.append(json.dumps(_field(block, "input", {})))
+        elif block_type == "tool_result":
+            parts.append(_content_text(_field(block, "content")))
+        elif block_type in ("thinking", "redacted_thinking"):
+            parts.append(
+                _field(block, "thinking", "") or _field(block, "data", "")
+            )
+    return "\n".join(parts)
+
+
+def _document_blocks(text: str) -> list[tuple[re.Match, bool]]:
+    """Copies of documents and UNCHANGED_DOCUMENT references to them, in
+    order of appearance; the flag is True for references."""
+    blocks = [(match, False) for match in DOCUMENT_PATTERN.finditer(text)]
+    blocks += [(match, True) for match in UNCHANGED_PATTERN.finditer(text)]
+    return sorted(blocks, key=lambda block: block[0].start())
+
+
+def _user_texts(message: MessageParam) -> list[str]:
+    if message["role"] != "user":
+        return []
+    content = message["content"]
+    if isinstance(content, str):
+        return [content]
+    return [
+        _field(block, "text", "")
+        for block in content
+        if _field(block, "type") == "text"
+    ]
+
+
+def estimate_tokens(message: MessageParam) -> int:
+    return len(_content_text(message["content"])) // CHARS_PER_TOKEN + 1
+
+
+def render_transcript(messages: list[MessageParam]) -> str:
+    """Renders messages as plain text for the summarizer."""
+    lines = []
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            lines.append(f"{message['role']}: {content}")
+            continue
+        for block in content:
+            block_type = _field(block, "type")
+            if block_type == "text":
+                lines.append(f"{message['role']}: {_field(block, 'text')}")
+            elif block_type == "tool_use":
+                lines.append(
+                    f"assistant called {_field(block, 'name')}"
+                    f"({json.dumps(_field(block, 'input', {}))})"
+                )
+            elif block_type == "tool_result":
+                result = _content_text(_field(block, "content"))
+                lines.append(f"tool result: {result[:2000]}")
+    return "\n".join(lines)
+
+
+class ConversationCompactor:
+    """Keeps Chat.messages under a token budget.
+
+    Older turns are shrunk in stages until the estimate fits: stale tool
+    results are replaced with a short note, earlier copies of a
+    <document> that appears again later are replaced with a reference,
+    and finally (if a summarizer is given) the oldest whole turns are
+    replaced by a summary. Messages are only ever rewritten, never
+    dropped individually, so tool_use/tool_result pairs stay intact. A
+    copy that a later UNCHANGED_DOCUMENT refers back to is never
+    superseded, and is put in place of the reference if summarizing
+    removes it.
+    """
+
+    ELIDED_RESULT = (
+        "[Result of {tool} elided to save context (~{tokens} tokens). "
+        "Call the tool again if you need it.]"
+    )
+    SUPERSEDED_DOCUMENT = (
+        '<document id="{doc_id}">[An up-to-date copy of this document is '
+        "included later in the conversation.]</document>"
+    )
+
+    def __init__(
+        self,
+        budget_tokens: int = 150_000,
+        keep_recent_messages: int = 6,
+        min_elided_tokens: int = 200,
+        summarizer: Optional[Summarizer] = None,
+    ):
+        self.budget_tokens = budget_tokens
+        self.keep_recent_messages = keep_recent_messages
+        self.min_elided_tokens = min_elided_tokens
+        self.summarizer = summarizer
+        self.compactions = 0
+        # Last message of a prefix whose summary came out no shorter, so
+        # the same prefix isn't sent to the summarizer again
+        self._unsummarizable: Optional[MessageParam] = None
+        # (message, estimate) aligned with the last list we saw, so only
+        # new or rewritten messages are re-estimated.
+        self._tracked: list[tuple[MessageParam, int]] = []
+
+    def token_counts(self, messages: list[MessageParam]) -> list[int]:
+        tracked = []
+        for i, message in enumerate(messages):
+            if i < len(self._tracked) and self._tracked[i][0] is message:
+                tracked.append(self._tracked[i])
+            else:
+                tracked.append((message, estimate_tokens(message)))
+        self._tracked = tracked
+        return [tokens for _, tokens in tracked]
+
+    def total_tokens(self, messages: list[MessageParam]) -> int:
+        return sum(self.token_counts(messages))
+
+    async def maybe_compact(self, messages: list[MessageParam]) -> bool:
+        """Compacts messages in place if they exceed the budget. Returns
+        whether any message was rewritten."""
+        if self.total_tokens(messages) <= self.budget_tokens:
+            return False
+
+        changed = self._elide_tool_results(messages)
+        if self.total_tokens(messages) > self.budget_tokens:
+            changed = self._dedupe_documents(messages) or changed
+        over_budget = self.total_tokens(messages) > self.budget_tokens
+        if over_budget and self.summarizer:
+            changed = await self._summarize_prefix(messages) or changed
+        if changed:
+            self.compactions += 1
+        return changed
+
+    def _compactable_range(self, messages: list[MessageParam]) -> range:
+        return range(max(len(messages) - self.keep_recent_messages, 0))
+
+    def _elide_tool_results(self, messages: list[MessageParam]) -> bool:
+        elided = False
+        tool_names: dict[str, str] = {}
+        for i in self._compactable_range(messages):
+            message = messages[i]
+            content = message["content"]
+            if isinstance(content, str):
+                continue
+
+            if message["role"] == "assistant":
+                for block in content:
+                    if _field(block, "type") == "tool_use":
+                        tool_names[_field(block, "id")] = _field(block, "name")
+                continue
+
+            changed = False
+            new_content = []
+            for block in content:
+                if _field(block, "type") == "tool_result":
+                    tokens = (
+                        len(_content_text(_field(block, "content")))
+                        // CHARS_PER_TOKEN
+                    )
+                    if tokens >= self.min_elided_tokens:
+                        tool = tool_names.get(
+                            _field(block, "tool_use_id"), "the tool"
+                        )
+                        block = {
+                            **block,
+                            "content": self.ELIDED_RESULT.format(
+                                tool=tool, tokens=tokens
+                            ),
+                        }
+                        changed = True
+                new_content.append(block)
+
+            if changed:
+                messages[i] = {**message, "content": new_content}
+                elided = True
+        return elided
+
+    def _dedupe_text(self, text: str, seen: set[str]) -> str:
+        # Matches are visited last to first, like the messages themselves
+        parts = []
+        end = len(text)
+        for match, reference in reversed(_document_blocks(text)):
+            doc_id = match.group("id")
+            parts.append(text[match.end() : end])
+            if reference:
+                # The copy it points back to must stay
+                seen.discard(doc_id)
+                parts.append(match.group(0))
+            elif doc_id in seen:
+                parts.append(self.SUPERSEDED_DOCUMENT.format(doc_id=doc_id))
+            else:
+                seen.add(doc_id)
+                parts.append(match.group(0))
+            end = match.start()
+        parts.append(text[:end])
+        return "".join(reversed(parts))
+
+    def _dedupe_documents(self, messages: list[MessageParam]) -> bool:
+        # Walk newest to oldest so the latest copy of each document wins
+        deduped = False
+        seen: set[str] = set()
+        compactable = self._compactable_range(messages)
+
+        for i in range(len(messages) - 1, -1, -1):
+            message = messages[i]
+            content = message["content"]
+            if message["role"] != "user":
+                continue
+
+            if isinstance(content, str):
+                new_content = self._dedupe_text(content, seen)
+            else:
+                new_content = [
+                    {
+                        **block,
+                        "text": self._dedupe_text(_field(block, "text"), seen),
+                    }
+                    if _field(block, "type") == "text"
+                    else block
+                    for block in reversed(content)
+                ][::-1]
+
+            if i in compactable and new_content != content:
+                messages[i] = {**message, "content": new_content}
+                deduped = True
+        return deduped
+
+    def _restore_text(
+        self, text: str, copies: dict[str, str], shown: set[str]
+    ) -> str:
+        parts = []
+        position = 0
+        for match, reference in _document_blocks(text):
+            doc_id = match.group("id")
+            if not reference:
+                shown.add(doc_id)
+            elif doc_id not in shown and doc_id in copies:
+                parts.append(text[position : match.start()])
+                parts.append(copies[doc_id])
+                position = match.end()
+                shown.add(doc_id)
+        parts.append(text[position:])
+        return "".join(parts)
+
+    def _restore_references(
+        self, removed: list[MessageParam], kept: list[MessageParam]
+    ) -> dict[int, MessageParam]:
+        """Rewrites of kept messages (by index) that replace the first
+        reference to each document copied in removed with that copy."""
+        copies: dict[str, str] = {}
+        for message in removed:
+            for text in _user_texts(message):
+                for match, reference in _document_blocks(text):
+                    if not reference:
+                        copies[match.group("id")] = match.group(0)
+
+        rewrites: dict[int, MessageParam] = {}
+        if not copies:
+            return rewrites
+        shown: set[str] = set()
+        for i, message in enumerate(kept):
+            if not any(
+                UNCHANGED_PATTERN.search(text) for text in _user_texts(message)
+            ):
+                for text in _user_texts(message):
+                    shown.update(
+                        match.group("id")
+                        for match in DOCUMENT_PATTERN.finditer(text)
+                    )
+                continue
+            content = message["content"]
+            if isinstance(content, str):
+                new_content = self._restore_text(content, copies, shown)
+            else:
+                new_content = [
+                    {
+                        **block,
+                        "text": self._restore_text(
+                            _field(block, "text"), copies, shown
+                        ),
+                    }
+                    if _field(block, "type") == "text"
+                    else block
+                    for block in content
+                ]
+            rewrites[i] = {**message, "content": new_content}
+        return rewrites
+
+    def _summary_boundary(self, messages: list[MessageParam]) -> int:
+        """Latest index outside the protected tail that starts a new turn.
+
+        A turn starts at a user message that is not a tool_result, so
+        cutting there can never split a tool_use from its result.
+        """
+        for i in reversed(self._compactable_range(messages)):
+            message = messages[i]
+            if i == 0 or message["role"] != "user":
+                continue
+            content = message["content"]
+            if isinstance(content, str) or not any(
+                _field(block, "type") == "tool_result" for block in content
+            ):
+                return i
+        return 0
+
+    async def _summarize_prefix(self, messages: list[MessageParam]) -> bool:
+        boundary = self._summary_boundary(messages)
+        if boundary < 2 or messages[boundary - 1] is self._unsummarizable:
+            return False
+
+        summary = await self.summarizer(messages[:boundary])
+        replacement: list[MessageParam] = [
+            {
+                "role": "user",
+                "content": "<conversation_summary>\n"
+                f"{summary}\n"
+                "</conversation_summary>",
+            },
+            {
+                "role": "assistant",
+                "content": "Understood, I'll continue from that summary.",
+            },
+        ]
+        restored = self._restore_references(
+            messages[:boundary], messages[boundary:]
+        )
+        counts = self.token_counts(messages)
+        added = sum(
+            estimate_tokens(message) - counts[boundary + i]
+            for i, message in restored.items()
+        )
+        if sum(map(estimate_tokens, replacement)) + added >= sum(
+            counts[:boundary]
+        ):
+            self._unsummarizable = messages[boundary - 1]
+            return False
+        for i, message in restored.items():
+            messages[boundary + i] = message
+        messages[:boundary] = replacement
+        return True
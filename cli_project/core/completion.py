@@ -0,0 +1,109 @@
+import bisect
+import heapq
+from typing import Iterable
+
+
+class CompletionIndex:
+    """Prefix and fuzzy lookup over a fixed set of names.
+
+    Built once per refresh; lookups never touch the whole corpus. Prefix
+    matches come from a binary search over the sorted lowercased names
+    (the same ranges a prefix trie would give, without a node per
+    character). If they don't fill a page, names containing the typed
+    characters in order are added, found by intersecting per-character
+    posting sets and ranked by how tightly and how early they match.
+    """
+
+    def __init__(self, names: Iterable[str]):
+        unique = sorted(set(names), key=lambda name: (name.lower(), name))
+        self._names = unique
+        self._keys = [name.lower() for name in unique]
+        # character -> positions in _names of names containing it
+        self._postings: dict[str, set[int]] = {}
+        for position, key in enumerate(self._keys):
+            for char in set(key):
+                self._postings.setdefault(char, set()).add(position)
+        # The last fuzzy query and the names it matched. Anything matching
+        # a longer query typed after it is among those, so each keystroke
+        # only rescans the previous matches.
+        self._last_fuzzy: tuple[str, set[int]] = ("", set(range(len(unique))))
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name: str) -> bool:
+        position = bisect.bisect_left(self._keys, name.lower())
+        while (
+            position < len(self._keys)
+            and self._keys[position] == name.lower()
+        ):
+            if self._names[position] == name:
+                return True
+            position += 1
+        return False
+
+    def prefix(self, text: str, limit: int) -> list[str]:
+        text = text.lower()
+        start = bisect.bisect_left(self._keys, text)
+        matches = []
+        for position in range(start, min(start + limit, len(self._keys))):
+            if not self._keys[position].startswith(text):
+                break
+            matches.append(self._names[position])
+        return matches
+
+    def fuzzy(self, text: str, limit: int) -> list[str]:
+        text = text.lower()
+        if not text:
+            return self._names[:limit]
+
+        last_text, last_matches = self._last_fuzzy
+        if last_text and text.startswith(last_text):
+            candidates = last_matches
+        else:
+            postings = sorted(
+                (self._postings.get(char, set()) for char in set(text)),
+                key=len,
+            )
+            candidates = set.intersection(*postings)
+
+        scored = []
+        for position in candidates:
+            score = _subsequence_score(self._keys[position], text)
+            if score is not None:
+                scored.append((score, position))
+        self._last_fuzzy = (text, {position for _, position in scored})
+        return [
+            self._names[position]
+            for _, position in heapq.nsmallest(limit, scored)
+        ]
+
+    def search(self, text: str, limit: int) -> list[str]:
+        """Prefix matches first, then fuzzy ones, at most `limit` names."""
+        matches = self.prefix(text, limit)
+        if len(matches) < limit and text:
+            seen = set(matches)
+            for name in self.fuzzy(text, limit + len(matches)):
+                if name not in seen:
+                    matches.append(name)
+                    if len(matches) == limit:
+                        break
+        return matches
+
+
+def _subsequence_score(key: str, text: str) -> tuple[int, int, int] | None:
+    """(characters skipped, first match index, length), lower is better;
+    None if the characters of `text` don't all appear in order."""
+    substring = key.find(text)
+    if substring >= 0:
+        return 0, substring, len(key)
+
+    first = index = key.find(text[0])
+    if index < 0:
+        return None
+    for char in text[1:]:
+        index = key.find(char, index + 1)
+        if index < 0:
+            return None
+    skipped = index - first + 1 - len(text)
+    return skipped, first, len(key)
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import json
+import os
+import struct
+import zlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from anthropic.types import MessageParam
+
+MAGIC = b"MCJ\x01"
+# kind, payload length, CRC-32 of the payload
+HEADER = struct.Struct("<BII")
+MESSAGE = 1
+SNAPSHOT = 2
+
+
+def _jsonable(value: Any) -> Any:
+    if hasattr(value, "model_dump"):
+        return value.model_dump(exclude_none=True)
+    raise TypeError(f"Cannot journal {type(value).__name__}")
+
+
+def _encode(value: Any) -> bytes:
+    return zlib.compress(
+        json.dumps(value, default=_jsonable, separators=(",", ":")).encode()
+    )
+
+
+def _decode(payload: bytes) -> Any:
+    return json.loads(zlib.decompress(payload))
+
+
+def _drop_unanswered_tool_use(messages: list[MessageParam]):
+    """Drops a final assistant message whose tool calls never got
+    results, as happens when the CLI exits while tools run; the API
+    rejects a conversation containing one."""
+    if not messages or messages[-1]["role"] != "assistant":
+        return
+    content = messages[-1]["content"]
+    if isinstance(content, list) and any(
+        block.get("type") == "tool_use" for block in content
+    ):
+        messages.pop()
+
+
+class SessionJournal:
+    """Append-only journal of a conversation's messages.
+
+    Each record is a small header (kind, length, CRC-32) followed by
+    zlib-compressed JSON: either one appended message or a snapshot of
+    the whole message list. Snapshots are written when the conversation
+    is rewritten (e.g. compacted) and every `snapshot_every` messages, so
+    loading decodes only what follows the last one. A record cut short by
+    a crash fails its CRC and is dropped on the next open.
+    """
+
+    def __init__(self, path: str, snapshot_every: int = 256):
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self._file = None
+        # Messages already in the journal, and appended since a snapshot
+        self._count = 0
+        self._since_snapshot = 0
+
+    def _scan(self, data: bytes) -> tuple[list[tuple[int, int, int]], int]:
+        """(kind, payload start, payload end) of every intact record, and
+        the offset where the intact records end."""
+        if not data.startswith(MAGIC):
+            raise ValueError(f"{self.path} is not a session journal")
+        records = []
+        offset = len(MAGIC)
+        while offset + HEADER.size <= len(data):
+            kind, length, crc = HEADER.unpack_from(data, offset)
+            start = offset + HEADER.size
+            end = start + length
+            if end > len(data) or zlib.crc32(data[start:end]) != crc:
+                break
+            records.append((kind, start, end))
+            offset = end
+        return records, offset
+
+    def load(self) -> list[MessageParam]:
+        """Replays the journal and opens it for appending."""
+        messages: list[MessageParam] = []
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                data = f.read()
+            records, valid_end = self._scan(data)
+
+            first = 0
+            for i, (kind, _, _) in enumerate(records):
+                if kind == SNAPSHOT:
+                    first = i
+            for kind, start, end in records[first:]:
+                value = _decode(data[start:end])
+                if kind == SNAPSHOT:
+                    messages = value
+                else:
+                    messages.append(value)
+            snapshotted = bool(records) and records[first][0] == SNAPSHOT
+            self._since_snapshot = len(records) - first - snapshotted
+
+            if valid_end < len(data):
+                with open(self.path, "r+b") as f:
+                    f.truncate(valid_end)
+        self._count = len(messages)
+        self._open()
+        dropped = len(messages)
+        _drop_unanswered_tool_use(messages)
+        if len(messages) < dropped:
+            # Record the repair so later appends line up with the journal
+            self.snapshot(messages)
+        return messages
+
+    def _open(self):
+        if self._file:
+            return
+        new = not os.path.exists(self.path) or not os.path.getsize(self.path)
+        # Journals hold whole conversations, so only their owner may read
+        # them
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self._file = os.fdopen(fd, "ab")
+        if new:
+            self._file.write(MAGIC)
+            self._file.flush()
+
+    def _write(self, kind: int, value: Any):
+        self._open()
+        payload = _encode(value)
+        self._file.write(
+            HEADER.pack(kind, len(payload), zlib.crc32(payload)) + payload
+        )
+        self._file.flush()
+
+    def append(self, messages: list[MessageParam]):
+        """Journals messages added since the last call."""
+        for message in messages[self._count :]:
+            if self._since_snapshot >= self.snapshot_every:
+                break
+            self._write(MESSAGE, message)
+            self._count += 1
+            self._since_snapshot += 1
+        if self._count < len(messages):
+            self.snapshot(messages)
+
+    def snapshot(self, messages: list[MessageParam]):
+        """Records the full message list, e.g. after it was rewritten."""
+        self._write(SNAPSHOT, messages)
+        self._count = len(messages)
+        self._since_snapshot = 0
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def compact_journal(path: str) -> tuple[int, int]:
+    """Rewrites a journal as a single snapshot, returning the sizes in
+    bytes before and after."""
+    before = os.path.getsize(path)
+    journal = SessionJournal(path)
+    messages = journal.load()
+    journal.close()
+
+    partial = f"{path}.{os.getpid()}.tmp"
+    compacted = SessionJournal(partial)
+    compacted.snapshot(messages)
+    compacted.close()
+    os.replace(partial, path)
+    return before, os.path.getsize(path)
+
+
+def session_dir() -> str:
+    """Where session journals live."""
+    return os.getenv("SESSION_DIR") or os.path.join(
+        os.path.expanduser("~"), ".mcp_chat", "sessions"
+    )
+
+
+def session_path(name: str) -> str:
+    return os.path.join(session_dir(), f"{name}.journal")
+
+
+def list_sessions() -> list[str]:
+    """Session names, most recently written last."""
+    directory = session_dir()
+    if not os.path.isdir(directory):
+        return []
+    journals = [
+        entry
+        for entry in os.scandir(directory)
+        if entry.name.endswith(".journal")
+    ]
+    journals.sort(key=lambda entry: entry.stat().st_mtime)
+    return [entry.name.removesuffix(".journal") for entry in journals]
@@ -0,0 +1,188 @@
+import bisect
+import json
+import os
+from typing import Any, Optional
+
+# Upper bounds in seconds, from a cache hit to a long model response
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5)
+LATENCY_BUCKETS += (1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _label_key(labels: dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> list[tuple[str, LabelKey, str, float]]:
+        return [(self.name, key, "", v) for key, v in self.values.items()]
+
+
+class Histogram:
+    """Cumulative bucket counts, a sum and a count per label set, as
+    Prometheus expects; quantiles are interpolated within a bucket."""
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help: str, buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.values: dict[LabelKey, tuple[list[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        counts, total, count = self.values.get(
+            key, ([0] * (len(self.buckets) + 1), 0.0, 0)
+        )
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.values[key] = (counts, total + value, count + 1)
+
+    def quantile(self, q: float, key: LabelKey) -> float:
+        counts, _, count = self.values[key]
+        rank = q * count
+        seen = 0
+        for i, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else lower
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def samples(self) -> list[tuple[str, LabelKey, str, float]]:
+        samples = []
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(
+                [*map(str, self.buckets), "+Inf"], counts
+            ):
+                cumulative += bucket_count
+                samples.append(
+                    (f"{self.name}_bucket", key, f'le="{bound}"', cumulative)
+                )
+            samples.append((f"{self.name}_sum", key, "", total))
+            samples.append((f"{self.name}_count", key, "", count))
+        return samples
+
+
+class MetricsRegistry:
+    """Counters and histograms for a session, exportable for dashboards.
+
+    Metrics are created on first use, so instrumented code just calls
+    metrics.counter(name, help).inc(...). Recording is a dict update,
+    cheap enough to leave on all the time. When configured with a path,
+    export() writes them there.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self.path = path
+
+    def configure(self, path: Optional[str]):
+        self.path = path
+
+    def export(self):
+        if self.path:
+            self.write(self.path)
+
+    def _get(self, cls, name: str, help: str, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, help, **kwargs)
+        return metric
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self._get(Counter, name, help)
+
+    def histogram(
+        self,
+        name: str,
+        help: str = "",
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for sample, key, extra, value in metric.samples():
+                lines.append(f"{sample}{_format_labels(key, extra)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self) -> dict[str, Any]:
+        snapshot = {}
+        for name, metric in sorted(self._metrics.items()):
+            series = []
+            for key, value in metric.values.items():
+                entry: dict[str, Any] = {"labels": dict(key)}
+                if isinstance(metric, Histogram):
+                    counts, total, count = value
+                    entry.update(
+                        count=count,
+                        sum=total,
+                        p50=metric.quantile(0.5, key),
+                        p90=metric.quantile(0.9, key),
+                    )
+                else:
+                    entry["value"] = value
+                series.append(entry)
+            snapshot[name] = {"type": metric.kind, "series": series}
+        return snapshot
+
+    def write(self, path: str):
+        """Writes a JSON snapshot if path ends in .json, otherwise the
+        Prometheus text format. The file is replaced atomically, so a
+        collector never reads a partial one."""
+        if path.endswith(".json"):
+            text = json.dumps(self.to_json(), indent=2)
+        else:
+            text = self.to_prometheus()
+        partial = f"{path}.{os.getpid()}.tmp"
+        with open(partial, "w") as f:
+            f.write(text)
+        os.replace(partial, path)
+
+    def summary(self) -> str:
+        """A table of every series, for /stats."""
+        rows = []
+        for name, metric in sorted(self._metrics.items()):
+            for key, value in sorted(metric.values.items()):
+                label = name + _format_labels(key)
+                if isinstance(metric, Histogram):
+                    _, total, count = value
+                    rows.append(
+                        f"{label:<64} n={count:<6}"
+                        f" mean={total / count * 1000:.0f}ms"
+                        f" p50={metric.quantile(0.5, key) * 1000:.0f}ms"
+                        f" p90={metric.quantile(0.9, key) * 1000:.0f}ms"
+                    )
+                else:
+                    rows.append(f"{label:<64} {value:g}")
+        return "\n".join(rows) if rows else "No metrics recorded yet."
+
+
+metrics = MetricsRegistry(os.getenv("METRICS_FILE"))
@@ -0,0 +1,95 @@
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+
+class Prefetcher:
+    """Fetches documents the user is about to mention, ahead of Enter.
+
+    prefetch() starts a fetch in the background; take() hands the result
+    to the query that mentions the document and forgets it, so content
+    is never reused across turns (where it could have been edited). At
+    most max_entries fetches are kept; older unused ones are dropped and
+    counted as wasted.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[str]],
+        max_entries: int = 16,
+    ):
+        self._fetch = fetch
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, asyncio.Task] = OrderedDict()
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted = 0
+
+    def prefetch(self, doc_id: str):
+        if doc_id in self._entries:
+            self._entries.move_to_end(doc_id)
+            return
+        self.started += 1
+        self._entries[doc_id] = asyncio.create_task(self._fetch(doc_id))
+        while len(self._entries) > self.max_entries:
+            _, task = self._entries.popitem(last=False)
+            self._discard(task)
+
+    def _discard(self, task: asyncio.Task):
+        self.wasted += 1
+        if task.done():
+            if not task.cancelled():
+                task.exception()
+        else:
+            task.cancel()
+
+    def discard_unused(self):
+        """Drops everything not taken by the query just submitted."""
+        while self._entries:
+            _, task = self._entries.popitem(last=False)
+            self._discard(task)
+
+    def invalidate(self, doc_id: str):
+        task = self._entries.pop(doc_id, None)
+        if task:
+            self._discard(task)
+
+    async def take(self, doc_id: str) -> Optional[str]:
+        """The prefetched content of doc_id, or None if it wasn't (or
+        couldn't be) prefetched."""
+        task = self._entries.pop(doc_id, None)
+        if task is None:
+            self.misses += 1
+            return None
+        try:
+            content = await task
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling():
+                raise
+            self.misses += 1
+            return None
+        except Exception:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return content
+
+    def stats(self) -> dict[str, float]:
+        used = self.hits + self.misses
+        return {
+            "started": self.started,
+            "hits": self.hits,
+            "misses": self.misses,
+            "wasted": self.wasted,
+            "pending": len(self._entries),
+            "hit_rate": self.hits / used if used else 0.0,
+        }
+
+    def summary(self) -> str:
+        stats = self.stats()
+        return (
+            f"prefetch hit rate {stats['hit_rate']:.0%}"
+            f" ({stats['hits']}/{stats['hits'] + stats['misses']})"
+            f" | fetched {stats['started']} | wasted {stats['wasted']}"
+        )
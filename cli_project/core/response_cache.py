@@ -0,0 +1,79 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+_MISSING = object()
+
+
+class ResponseCache:
+    """LRU cache of server responses, bounded by entry count and size.
+
+    Entries may carry a TTL. Sizes are whatever the caller measures
+    (bytes of serialized payload, here); the least recently used entries
+    are evicted until both limits hold again.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        max_bytes: int = 32 * 1024 * 1024,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (value, size, expires_at or None)
+        self._entries: OrderedDict[
+            Hashable, tuple[Any, int, Optional[float]]
+        ] = OrderedDict()
+        self.total_bytes = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        value, _, expires_at = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            self.pop(key)
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def put(
+        self,
+        key: Hashable,
+        value: Any,
+        size: int,
+        ttl: Optional[float] = None,
+    ):
+        if size > self.max_bytes:
+            return
+        self.pop(key)
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._entries[key] = (value, size, expires_at)
+        self.total_bytes += size
+        while (
+            len(self._entries) > self.max_entries
+            or self.total_bytes > self.max_bytes
+        ):
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+
+    def pop(self, key: Hashable):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def keys(self) -> list[Hashable]:
+        """Keys currently held, expired or not, least recently used first."""
+        return list(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+        self.total_bytes = 0
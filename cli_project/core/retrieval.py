@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Optional
+
+if TYPE_CHECKING:
+    # numpy is imported on first use, keeping it off the startup path
+    import numpy as np
+
+EMBEDDING_DIM = 1024
+TOKEN_PATTERN = re.compile(r"\w+")
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or "
+    "that the this to was were will with".split()
+)
+
+Embedder = Callable[[list[str]], "np.ndarray"]
+
+
+@lru_cache(maxsize=65536)
+def _feature(token: str, dim: int) -> tuple[int, float]:
+    digest = zlib.crc32(token.encode())
+    return digest % dim, 1.0 if digest >> 31 else -1.0
+
+
+def hashing_embedding(texts: list[str], dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """Embeds texts by hashing their words and word pairs into dim buckets.
+
+    Deterministic and offline: two texts score highly when they share
+    uncommon words. Rows are L2-normalized, so a dot product is the
+    cosine similarity.
+    """
+    import numpy as np
+
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        words = [
+            word
+            for word in TOKEN_PATTERN.findall(text.lower())
+            if word not in STOP_WORDS
+        ]
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        if not features:
+            continue
+        indexes, signs = zip(*(_feature(f, dim) for f in features))
+        counts = np.bincount(indexes, weights=signs, minlength=dim)
+        # Dampen repeated words so one term can't dominate a chunk
+        vectors[row] = np.sign(counts) * np.log1p(np.abs(counts))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def chunk_text(text: str, max_chars: int = 1000) -> list[tuple[int, str]]:
+    """Splits text into (offset, chunk) pieces of at most max_chars,
+    preferring paragraph, then line, then word boundaries."""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            for separator in ("\n\n", "\n", " "):
+                cut = text.rfind(separator, start, end)
+                if cut > start:
+                    end = cut
+                    break
+        piece = text[start:end]
+        if piece.strip():
+            offset = start + len(piece) - len(piece.lstrip())
+            chunks.append((offset, piece.strip()))
+        start = end
+    return chunks
+
+
+@dataclass
+class Chunk:
+    doc_id: str
+    start: int
+    text: str
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.text)
+
+
+@dataclass
+class _IndexedDoc:
+    digest: bytes
+    chunks: list[Chunk]
+    vectors: Optional[np.ndarray]
+
+
+class ChunkIndex:
+    """Vector index over chunks of documents, for picking context.
+
+    update() re-chunks a document only when its content changed and
+    re-embeds only chunks whose text is new, so an edit to one paragraph
+    costs one embedding rather than the whole document. Each document's
+    vectors are kept apart and stacked into one matrix on the next
+    search, so a batch of updates costs one concatenation. Updates may
+    run in a worker thread while the event loop searches.
+    """
+
+    def __init__(
+        self,
+        embed: Optional[Embedder] = None,
+        chunk_chars: int = 1000,
+    ):
+        self.embed = embed or hashing_embedding
+        self.chunk_chars = chunk_chars
+        self._docs: dict[str, _IndexedDoc] = {}
+        # All chunks and their vectors, rebuilt after a change
+        self._stacked: Optional[tuple[list[Chunk], Optional[np.ndarray]]] = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._docs
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(doc.chunks) for doc in self._docs.values())
+
+    @property
+    def doc_ids(self) -> list[str]:
+        with self._lock:
+            return list(self._docs)
+
+    def update(self, doc_id: str, content: str):
+        import numpy as np
+
+        digest = hashlib.blake2b(content.encode(), digest_size=16).digest()
+        current = self._docs.get(doc_id)
+        if current is not None and current.digest == digest:
+            return
+
+        previous = {}
+        if current is not None and current.chunks:
+            previous = dict(
+                zip((chunk.text for chunk in current.chunks), current.vectors)
+            )
+        chunks = [
+            Chunk(doc_id, start, text)
+            for start, text in chunk_text(content, self.chunk_chars)
+        ]
+        new_texts = list(
+            dict.fromkeys(c.text for c in chunks if c.text not in previous)
+        )
+        if new_texts:
+            previous.update(zip(new_texts, self.embed(new_texts)))
+        vectors = (
+            np.stack([previous[chunk.text] for chunk in chunks])
+            if chunks
+            else None
+        )
+
+        with self._lock:
+            self._docs[doc_id] = _IndexedDoc(digest, chunks, vectors)
+            self._stacked = None
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            if self._docs.pop(doc_id, None) is not None:
+                self._stacked = None
+
+    def _matrix(self) -> tuple[list[Chunk], Optional[np.ndarray]]:
+        import numpy as np
+
+        with self._lock:
+            if self._stacked is None:
+                docs = [doc for doc in self._docs.values() if doc.chunks]
+                self._stacked = (
+                    [chunk for doc in docs for chunk in doc.chunks],
+                    np.concatenate([doc.vectors for doc in docs])
+                    if docs
+                    else None,
+                )
+            return self._stacked
+
+    def search(self, query: str, k: int) -> list[tuple[float, Chunk]]:
+        """The k chunks most similar to query, best first. Chunks with
+        nothing in common with the query are left out."""
+        import numpy as np
+
+        chunks, vectors = self._matrix()
+        if not chunks or k <= 0:
+            return []
+        scores = vectors @ self.embed([query])[0]
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), chunks[i]) for i in top if scores[i] > 0]
@@ -0,0 +1,59 @@
+import atexit
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+
+class SpillStore:
+    """Content-addressed files holding tool results too large to inline.
+
+    A result is stored once under the hash of its text, so the same large
+    output spilled twice shares one file and one handle. Unless another
+    directory is given, files live in a private temp directory, made on
+    the first spill and removed when the process exits.
+    """
+
+    HANDLE_LENGTH = 16
+
+    def __init__(self, directory: Optional[str] = None):
+        self._directory = directory
+
+    @property
+    def directory(self) -> str:
+        if self._directory is None:
+            # mkdtemp picks an unguessable name and creates it 0o700
+            self._directory = tempfile.mkdtemp(prefix="mcp-chat-spill-")
+            atexit.register(shutil.rmtree, self._directory, True)
+        return self._directory
+
+    def _path(self, handle: str) -> str:
+        if len(handle) != self.HANDLE_LENGTH or not all(
+            c in "0123456789abcdef" for c in handle
+        ):
+            raise ValueError(f"Invalid spill handle: {handle!r}")
+        return os.path.join(self.directory, f"{handle}.txt")
+
+    def put(self, text: str) -> str:
+        handle = hashlib.sha256(text.encode()).hexdigest()[
+            : self.HANDLE_LENGTH
+        ]
+        path = self._path(handle)
+        if not os.path.exists(path):
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            # Write then rename, so a reader never sees a partial file
+            partial = f"{path}.{os.getpid()}.tmp"
+            with open(partial, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(partial, path)
+        return handle
+
+    def read(self, handle: str) -> str:
+        if self._directory is None:
+            raise ValueError(f"Unknown spill handle: {handle}")
+        try:
+            with open(self._path(handle), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise ValueError(f"Unknown spill handle: {handle}") from None
@@ -0,0 +1,55 @@
+import importlib
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+
+class StartupProfile:
+    """Wall-clock time of each startup phase, for --profile-startup.
+
+    Phases are timed from `began`, which main.py takes before its own
+    imports. Background imports overlap the other phases (or, for those
+    started once the prompt is up, the user's typing) and are listed
+    apart.
+    """
+
+    def __init__(self, began: Optional[float] = None):
+        self.began = began if began is not None else time.perf_counter()
+        self.phases: list[tuple[str, float]] = []
+        self.background: list[tuple[str, float]] = []
+        self.ready: Optional[float] = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def mark_ready(self):
+        """Records the moment the first prompt would be shown."""
+        self.ready = time.perf_counter()
+
+    def import_modules(self, modules: tuple[str, ...]):
+        """Imports modules, timing each; meant to run in a thread so the
+        event loop carries on meanwhile."""
+        for module in modules:
+            start = time.perf_counter()
+            importlib.import_module(module)
+            self.background.append(
+                (f"import {module}", time.perf_counter() - start)
+            )
+
+    def report(self) -> str:
+        rows = [f"{'phase':<40}{'ms':>10}"]
+        for name, seconds in self.phases:
+            rows.append(f"{name:<40}{seconds * 1000:>10.1f}")
+        for name, seconds in self.background:
+            rows.append(f"{name + ' (background)':<40}{seconds * 1000:>10.1f}")
+        if self.ready is not None:
+            rows.append(
+                f"{'time to first prompt':<40}"
+                f"{(self.ready - self.began) * 1000:>10.1f}"
+            )
+        return "\n".join(rows)
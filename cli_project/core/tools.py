@@ -1,38 +1,152 @@
+from __future__ import annotations
+
+import asyncio
 import json
-from typing import Optional, Literal, List
-from mcp.types import CallToolResult, Tool, TextContent
+import time
+from typing import TYPE_CHECKING, Optional, Literal, List
+from mcp.types import CallToolResult, TextContent
 from mcp_client import MCPClient
-from anthropic.types import Message, ToolResultBlockParam
+from core.metrics import metrics
+from core.spill import SpillStore
+from core.tracing import payload_size, tracer
+
+if TYPE_CHECKING:
+    from anthropic.types import (
+        Message,
+        ToolParam,
+        ToolResultBlockParam,
+        ToolUseBlock,
+    )
 
 
 class ToolManager:
-    @classmethod
-    async def get_all_tools(cls, clients: dict[str, MCPClient]) -> list[Tool]:
+    # Tools that must not overlap. The value names the input field that
+    # scopes the lock (e.g. one edit at a time per doc_id); None means the
+    # tool is serialized globally.
+    DEFAULT_SERIAL_TOOLS: dict[str, Optional[str]] = {
+        "edit_document": "doc_id",
+        "batch_edit_documents": None,
+        "find_replace_documents": None,
+    }
+
+    # Built-in tool for paging through results that were spilled to disk
+    READ_SPILLED_TOOL: ToolParam = {
+        "name": "read_spilled_result",
+        "description": "Reads part of a tool result that was too large to "
+        "show in full. Use the handle from the truncated result and an "
+        "offset (in characters) to page through it.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "handle": {"type": "string"},
+                "offset": {"type": "integer", "minimum": 0, "default": 0},
+                "length": {"type": "integer", "minimum": 1},
+            },
+            "required": ["handle"],
+        },
+    }
+
+    def __init__(
+        self,
+        clients: dict[str, MCPClient],
+        concurrent: bool = True,
+        max_concurrency_per_server: int = 4,
+        tool_timeout: Optional[float] = 60.0,
+        serial_tools: Optional[dict[str, Optional[str]]] = None,
+        max_result_chars: Optional[int] = 20_000,
+        preview_chars: int = 2_000,
+        spill_store: Optional[SpillStore] = None,
+    ):
+        self.clients = clients
+        self.concurrent = concurrent
+        self.max_concurrency_per_server = max_concurrency_per_server
+        self.tool_timeout = tool_timeout
+        self.serial_tools = (
+            dict(self.DEFAULT_SERIAL_TOOLS)
+            if serial_tools is None
+            else serial_tools
+        )
+        # Results longer than max_result_chars (None for no limit) are
+        # spilled and replaced by a preview of preview_chars characters.
+        self.max_result_chars = max_result_chars
+        self.preview_chars = preview_chars
+        self.spill_store = spill_store or SpillStore()
+        self._semaphores: dict[MCPClient, asyncio.Semaphore] = {}
+        self._serial_locks: dict[tuple, asyncio.Lock] = {}
+        # tool name -> client that serves it, plus the Anthropic-shaped
+        # schemas. Rebuilt only when a client's tools_generation moves.
+        self._routes: dict[str, MCPClient] = {}
+        self._tool_schemas: list[ToolParam] = []
+        self._generations: Optional[dict[str, int]] = None
+        self._rebuild_lock = asyncio.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def cache_info(self) -> dict[str, int]:
+        """Returns hit/miss counters for the routing cache."""
+        return {
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "tools": len(self._routes),
+        }
+
+    def _current_generations(self) -> dict[str, int]:
+        return {
+            client_id: client.tools_generation
+            for client_id, client in self.clients.items()
+        }
+
+    async def _ensure_routes(self):
+        if self._generations == self._current_generations():
+            self.cache_hits += 1
+            return
+
+        async with self._rebuild_lock:
+            generations = self._current_generations()
+            if self._generations == generations:
+                self.cache_hits += 1
+                return
+
+            self.cache_misses += 1
+            routes: dict[str, MCPClient] = {}
+            schemas: list[ToolParam] = []
+            for client in self.clients.values():
+                for t in await client.list_tools():
+                    # First client to offer a tool name wins, as before
+                    if t.name in routes:
+                        continue
+                    routes[t.name] = client
+                    schemas.append(
+                        {
+                            "name": t.name,
+                            "description": t.description,
+                            "input_schema": t.inputSchema,
+                        }
+                    )
+
+            if self.max_result_chars is not None:
+                schemas.append(self.READ_SPILLED_TOOL)
+            self._routes = routes
+            self._tool_schemas = schemas
+            self._generations = generations
+
+    async def get_all_tools(self) -> list[ToolParam]:
         """Gets all tools from the provided clients."""
-        tools = []
-        for client in clients.values():
-            tool_models = await client.list_tools()
-            tools += [
-                {
-                    "name": t.name,
-                    "description": t.description,
-                    "input_schema": t.inputSchema,
-                }
-                for t in tool_models
-            ]
-        return tools
+        with tracer.span("tools.get_all_tools") as span:
+            misses = self.cache_misses
+            await self._ensure_routes()
+            span.set(
+                cache_hit=self.cache_misses == misses,
+                tools=len(self._tool_schemas),
+            )
+        return self._tool_schemas
 
-    @classmethod
     async def _find_client_with_tool(
-        cls, clients: list[MCPClient], tool_name: str
+        self, tool_name: str
     ) -> Optional[MCPClient]:
         """Finds the first client that has the specified tool."""
-        for client in clients:
-            tools = await client.list_tools()
-            tool = next((t for t in tools if t.name == tool_name), None)
-            if tool:
-                return client
-        return None
+        await self._ensure_routes()
+        return self._routes.get(tool_name)
 
     @classmethod
     def _build_tool_result_part(
@@ -50,58 +164,204 @@ class ToolManager:
         }
 
     @classmethod
-    async def execute_tool_requests(
-        cls, clients: dict[str, MCPClient], message: Message
-    ) -> List[ToolResultBlockParam]:
-        """Executes a list of tool requests against the provided clients."""
-        tool_requests = [
-            block for block in message.content if block.type == "tool_use"
-        ]
-        tool_result_blocks: list[ToolResultBlockParam] = []
-        for tool_request in tool_requests:
-            tool_use_id = tool_request.id
-            tool_name = tool_request.name
-            tool_input = tool_request.input
-
-            client = await cls._find_client_with_tool(
-                list(clients.values()), tool_name
+    def _serialize_content(cls, content_list: list[str]) -> str:
+        # A single text item (the common case) is passed through as is;
+        # wrapping it in a JSON list would escape every quote and newline.
+        if len(content_list) == 1:
+            return content_list[0]
+        return json.dumps(content_list, ensure_ascii=False)
+
+    def _limit_size(self, text: str) -> str:
+        """Spills text over max_result_chars, returning a head/tail preview
+        with the handle to page through the rest."""
+        if self.max_result_chars is None or len(text) <= self.max_result_chars:
+            return text
+
+        handle = self.spill_store.put(text)
+        head = self.preview_chars * 3 // 4
+        tail = self.preview_chars - head
+        omitted = len(text) - head - tail
+        return (
+            f"[Result too large: {len(text)} characters, stored as handle "
+            f'"{handle}". Showing the first {head} and last {tail}; call '
+            f"{self.READ_SPILLED_TOOL['name']} with the handle and an "
+            "offset to read the rest.]\n"
+            f"{text[:head]}\n"
+            f"[... {omitted} characters omitted, offsets {head} to "
+            f"{head + omitted} ...]\n"
+            f"{text[len(text) - tail:]}"
+        )
+
+    def _read_spilled(self, tool_input: dict) -> str:
+        text = self.spill_store.read(str(tool_input.get("handle", "")))
+        offset = max(int(tool_input.get("offset", 0)), 0)
+        length = int(tool_input.get("length") or self.max_result_chars)
+        # Pages are never spilled again
+        length = min(max(length, 1), self.max_result_chars)
+        end = min(offset + length, len(text))
+        return (
+            f"[Characters {offset} to {end} of {len(text)}"
+            f"{'' if end < len(text) else ', end of result'}]\n"
+            f"{text[offset:end]}"
+        )
+
+    def _serial_lock(
+        self, tool_name: str, tool_input: dict
+    ) -> Optional[asyncio.Lock]:
+        if tool_name not in self.serial_tools:
+            return None
+        scope_key = self.serial_tools[tool_name]
+        key = (
+            (tool_name, str(tool_input.get(scope_key)))
+            if scope_key
+            else (tool_name,)
+        )
+        if key not in self._serial_locks:
+            self._serial_locks[key] = asyncio.Lock()
+        return self._serial_locks[key]
+
+    def _server_semaphore(self, client: MCPClient) -> asyncio.Semaphore:
+        if client not in self._semaphores:
+            self._semaphores[client] = asyncio.Semaphore(
+                self.max_concurrency_per_server
             )
+        return self._semaphores[client]
 
-            if not client:
-                tool_result_part = cls._build_tool_result_part(
-                    tool_use_id, "Could not find that tool", "error"
+    async def _call_tool(
+        self, client: MCPClient, tool_name: str, tool_input: dict
+    ) -> CallToolResult | None:
+        async with self._server_semaphore(client):
+            return await asyncio.wait_for(
+                client.call_tool(tool_name, tool_input),
+                timeout=self.tool_timeout,
+            )
+
+    async def _execute_tool_request(
+        self, tool_request: ToolUseBlock
+    ) -> ToolResultBlockParam:
+        """Executes a single tool_use block and builds its result part."""
+        with tracer.span(
+            "tools.execute_tool", tool=tool_request.name
+        ) as span:
+            started = time.perf_counter()
+            result = await self._run_tool_request(tool_request)
+            metrics.histogram(
+                "tool_call_seconds", "Tool call latency, including queueing"
+            ).observe(time.perf_counter() - started, tool=tool_request.name)
+            metrics.counter("tool_calls_total", "Tool calls by outcome").inc(
+                tool=tool_request.name,
+                status="error" if result["is_error"] else "success",
+            )
+            if span.recording:
+                span.set(
+                    input_bytes=payload_size(tool_request.input),
+                    result_bytes=payload_size(result["content"]),
+                    is_error=result["is_error"],
                 )
-                tool_result_blocks.append(tool_result_part)
-                continue
+            return result
 
+    async def _run_tool_request(
+        self, tool_request: ToolUseBlock
+    ) -> ToolResultBlockParam:
+        tool_use_id = tool_request.id
+        tool_name = tool_request.name
+        tool_input = tool_request.input
+
+        if (
+            tool_name == self.READ_SPILLED_TOOL["name"]
+            and self.max_result_chars is not None
+        ):
             try:
-                tool_output: CallToolResult | None = await client.call_tool(
-                    tool_name, tool_input
+                return self._build_tool_result_part(
+                    tool_use_id, self._read_spilled(tool_input), "success"
                 )
-                items = []
-                if tool_output:
-                    items = tool_output.content
-                content_list = [
-                    item.text for item in items if isinstance(item, TextContent)
-                ]
-                content_json = json.dumps(content_list)
-                tool_result_part = cls._build_tool_result_part(
-                    tool_use_id,
-                    content_json,
-                    "error"
-                    if tool_output and tool_output.isError
-                    else "success",
+            except (ValueError, TypeError) as e:
+                return self._build_tool_result_part(
+                    tool_use_id, json.dumps({"error": str(e)}), "error"
                 )
-            except Exception as e:
-                error_message = f"Error executing tool '{tool_name}': {e}"
-                print(error_message)
-                tool_result_part = cls._build_tool_result_part(
-                    tool_use_id,
-                    json.dumps({"error": error_message}),
-                    "error"
-                    if tool_output and tool_output.isError
-                    else "success",
+
+        client = await self._find_client_with_tool(tool_name)
+
+        if not client:
+            return self._build_tool_result_part(
+                tool_use_id, "Could not find that tool", "error"
+            )
+
+        tool_output: CallToolResult | None = None
+        try:
+            lock = self._serial_lock(tool_name, tool_input)
+            if lock:
+                async with lock:
+                    tool_output = await self._call_tool(
+                        client, tool_name, tool_input
+                    )
+            else:
+                tool_output = await self._call_tool(
+                    client, tool_name, tool_input
                 )
+            items = []
+            if tool_output:
+                items = tool_output.content
+            content_list = [
+                item.text for item in items if isinstance(item, TextContent)
+            ]
+            return self._build_tool_result_part(
+                tool_use_id,
+                self._limit_size(self._serialize_content(content_list)),
+                "error" if tool_output and tool_output.isError else "success",
+            )
+        except asyncio.TimeoutError:
+            error_message = (
+                f"Tool '{tool_name}' timed out after {self.tool_timeout}s"
+            )
+        except Exception as e:
+            error_message = f"Error executing tool '{tool_name}': {e}"
+
+        print(error_message)
+        return self._build_tool_result_part(
+            tool_use_id, json.dumps({"error": error_message}), "error"
+        )
 
-            tool_result_blocks.append(tool_result_part)
-        return tool_result_blocks
+    def start_tool_request(
+        self, tool_request: ToolUseBlock
+    ) -> "asyncio.Task[ToolResultBlockParam]":
+        """Starts a tool_use block in the background.
+
+        Used while a response is still streaming so a tool call does not
+        wait for the rest of the message.
+        """
+        return asyncio.create_task(self._execute_tool_request(tool_request))
+
+    async def execute_tool_requests(
+        self, message: Message
+    ) -> List[ToolResultBlockParam]:
+        """Executes a list of tool requests against the provided clients.
+
+        In concurrent mode every tool_use block is dispatched at once;
+        results are always returned in the order of the blocks.
+        """
+        tool_requests = [
+            block for block in message.content if block.type == "tool_use"
+        ]
+        with tracer.span(
+            "tools.execute_tool_requests", count=len(tool_requests)
+        ):
+            return await self._execute_all(tool_requests)
+
+    async def _execute_all(
+        self, tool_requests: list[ToolUseBlock]
+    ) -> List[ToolResultBlockParam]:
+        if not self.concurrent:
+            return [
+                await self._execute_tool_request(tool_request)
+                for tool_request in tool_requests
+            ]
+
+        return list(
+            await asyncio.gather(
+                *(
+                    self._execute_tool_request(tool_request)
+                    for tool_request in tool_requests
+                )
+            )
+        )
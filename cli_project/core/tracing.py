@@ -0,0 +1,133 @@
+import itertools
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import IO, Any, Iterator, Optional
+
+
+class Span:
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        span_id: int,
+        parent_id: Optional[int],
+        attrs: dict[str, Any],
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = time.time()
+        self._start_perf = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+
+    @property
+    def recording(self) -> bool:
+        return True
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "attrs": self.attrs,
+        }
+
+
+class _NoopSpan:
+    recording = False
+
+    def set(self, **attrs):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar(
+    "current_span", default=None
+)
+
+
+class Tracer:
+    """Writes spans as JSON lines to a local file.
+
+    Disabled (and close to free) until configured with a path. Spans nest
+    through a ContextVar, so tasks created inside a span become its
+    children. Use span.recording to skip computing expensive attributes
+    when tracing is off.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self._file: Optional[IO[str]] = None
+        self._ids = itertools.count(1)
+        self.configure(path)
+
+    @property
+    def enabled(self) -> bool:
+        return self._file is not None
+
+    def configure(self, path: Optional[str]):
+        if self._file:
+            self._file.close()
+        self._file = open(path, "a", buffering=1) if path else None
+
+    @contextmanager
+    def span(
+        self, name: str, activate: bool = True, **attrs
+    ) -> Iterator[Span | _NoopSpan]:
+        """Records a span around the block.
+
+        Pass activate=False from async generators: they run in their
+        consumer's context, so an active span would leak to the caller
+        between yields.
+        """
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+
+        parent = _current_span.get()
+        span = Span(
+            name,
+            trace_id=parent.trace_id if parent else os.urandom(8).hex(),
+            span_id=next(self._ids),
+            parent_id=parent.span_id if parent else None,
+            attrs=attrs,
+        )
+        token = _current_span.set(span) if activate else None
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            if token:
+                _current_span.reset(token)
+            span.duration_ms = (time.perf_counter() - span._start_perf) * 1000
+            if self._file:
+                self._file.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+
+def _jsonable(value: Any) -> Any:
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return str(value)
+
+
+def payload_size(value: Any) -> int:
+    """Approximate serialized size in bytes, for span attributes."""
+    if isinstance(value, str):
+        return len(value.encode())
+    return len(json.dumps(value, default=_jsonable))
+
+
+tracer = Tracer(os.getenv("TRACE_FILE"))
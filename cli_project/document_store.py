@@ -0,0 +1,402 @@
+import json
+import re
+import sqlite3
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Iterator, Optional
+
+# (start, end, replacement) against the previous version of a document
+Span = tuple[int, int, str]
+
+
+def find_spans(content: str, old_string: str, new_string: str) -> list[Span]:
+    """Spans equivalent to content.replace(old_string, new_string)."""
+    spans = []
+    start = content.find(old_string)
+    while start != -1 and old_string:
+        end = start + len(old_string)
+        spans.append((start, end, new_string))
+        start = content.find(old_string, end)
+    return spans
+
+
+def find_pattern_spans(
+    content: str, pattern: re.Pattern, replacement: str
+) -> list[Span]:
+    """Spans equivalent to pattern.sub(replacement, content)."""
+    return [
+        (match.start(), match.end(), match.expand(replacement))
+        for match in pattern.finditer(content)
+    ]
+
+
+def diff_span(old: str, new: str) -> list[Span]:
+    """A single span turning old into new, trimming the common prefix and
+    suffix. Used when several edits to a document are combined."""
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while (
+        suffix < limit - prefix
+        and old[len(old) - 1 - suffix] == new[len(new) - 1 - suffix]
+    ):
+        suffix += 1
+    if prefix == len(old) == len(new):
+        return []
+    return [(prefix, len(old) - suffix, new[prefix : len(new) - suffix])]
+
+
+def newline_delta(content: str, spans: list[Span]) -> int:
+    """How many newlines applying spans to content adds (or removes)."""
+    return sum(
+        replacement.count("\n") - content.count("\n", start, end)
+        for start, end, replacement in spans
+    )
+
+
+def line_count(size: int, newlines: int) -> int:
+    return newlines + 1 if size else 0
+
+
+def apply_spans(content: str, spans: list[Span]) -> str:
+    parts = []
+    position = 0
+    for start, end, replacement in spans:
+        parts.append(content[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(content[position:])
+    return "".join(parts)
+
+
+class DocumentStore(ABC):
+    """Storage behind the DocumentMCP server.
+
+    Every change to a document bumps its version, starting at 1.
+    Methods raise KeyError for unknown doc_ids.
+    """
+
+    @abstractmethod
+    def list_ids(self) -> list[str]: ...
+
+    @abstractmethod
+    def exists(self, doc_id: str) -> bool: ...
+
+    @abstractmethod
+    def version(self, doc_id: str) -> int: ...
+
+    @abstractmethod
+    def read(self, doc_id: str) -> str: ...
+
+    def contents(self) -> Iterator[tuple[str, str]]:
+        """(doc_id, content) of every document, for a pass over all of
+        them such as indexing. Unlike read(), this doesn't fill a cache."""
+        for doc_id in self.list_ids():
+            yield doc_id, self.read(doc_id)
+
+    def size(self, doc_id: str) -> int:
+        """Length in characters."""
+        return len(self.read(doc_id))
+
+    def lines(self, doc_id: str) -> int:
+        content = self.read(doc_id)
+        return line_count(len(content), content.count("\n"))
+
+    @abstractmethod
+    def put(self, doc_id: str, content: str) -> int:
+        """Creates or overwrites a document, returning its new version."""
+
+    @abstractmethod
+    def apply(self, doc_id: str, spans: list[Span]) -> int:
+        """Applies sorted, non-overlapping spans, returning the new version."""
+
+    def apply_many(self, changes: dict[str, list[Span]]) -> dict[str, int]:
+        """Applies spans to several documents as one change, all or none,
+        returning each document's new version."""
+        for doc_id in changes:
+            self.version(doc_id)
+        return {
+            doc_id: self.apply(doc_id, spans)
+            for doc_id, spans in changes.items()
+        }
+
+    def replace(self, doc_id: str, old_string: str, new_string: str) -> int:
+        spans = find_spans(self.read(doc_id), old_string, new_string)
+        return self.apply(doc_id, spans)
+
+    def seed(self, docs: dict[str, str]):
+        """Adds any of docs that the store doesn't have yet."""
+        for doc_id, content in docs.items():
+            if not self.exists(doc_id):
+                self.put(doc_id, content)
+
+
+class InMemoryDocumentStore(DocumentStore):
+    def __init__(self):
+        # Content, version and newline count of each document
+        self._docs: dict[str, tuple[str, int, int]] = {}
+
+    def list_ids(self) -> list[str]:
+        return list(self._docs)
+
+    def exists(self, doc_id: str) -> bool:
+        return doc_id in self._docs
+
+    def version(self, doc_id: str) -> int:
+        return self._docs[doc_id][1]
+
+    def read(self, doc_id: str) -> str:
+        return self._docs[doc_id][0]
+
+    def lines(self, doc_id: str) -> int:
+        content, _, newlines = self._docs[doc_id]
+        return line_count(len(content), newlines)
+
+    def put(self, doc_id: str, content: str) -> int:
+        version = self._docs[doc_id][1] + 1 if doc_id in self._docs else 1
+        self._docs[doc_id] = (content, version, content.count("\n"))
+        return version
+
+    def apply(self, doc_id: str, spans: list[Span]) -> int:
+        content, version, newlines = self._docs[doc_id]
+        self._docs[doc_id] = (
+            apply_spans(content, spans),
+            version + 1,
+            newlines + newline_delta(content, spans),
+        )
+        return version + 1
+
+
+class SQLiteDocumentStore(DocumentStore):
+    """Append-only, versioned store in a single SQLite file.
+
+    Each version is a row in `revisions`: either a full snapshot or a
+    patch holding only the replaced spans, so an edit writes O(edit size)
+    bytes. Reading a version replays patches on top of the nearest
+    snapshot; a new snapshot is written every `snapshot_every` versions to
+    bound that replay. Contents are loaded lazily and kept in an LRU
+    bounded by `cache_chars`. Each document's size and newline count are
+    kept alongside its version, so stats don't need the content; the
+    newline count is left unknown (NULL) after a patch to a document that
+    wasn't cached and is recounted on the next lines() call.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS documents (
+        doc_id TEXT PRIMARY KEY,
+        version INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        snapshot_version INTEGER NOT NULL,
+        newlines INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS revisions (
+        doc_id TEXT NOT NULL,
+        version INTEGER NOT NULL,
+        kind TEXT NOT NULL CHECK (kind IN ('snapshot', 'patch')),
+        payload TEXT NOT NULL,
+        PRIMARY KEY (doc_id, version)
+    );
+    """
+
+    def __init__(
+        self,
+        path: str,
+        snapshot_every: int = 32,
+        cache_chars: int = 64 * 1024 * 1024,
+    ):
+        self.snapshot_every = snapshot_every
+        self.cache_chars = cache_chars
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self.SCHEMA)
+        columns = {
+            row[1]
+            for row in self._conn.execute("PRAGMA table_info(documents)")
+        }
+        if "newlines" not in columns:
+            # Stores created before newline counts were kept
+            self._conn.execute(
+                "ALTER TABLE documents ADD COLUMN newlines INTEGER"
+            )
+        self._cache: OrderedDict[str, tuple[int, str]] = OrderedDict()
+        self._cached_chars = 0
+
+    def close(self):
+        self._conn.close()
+
+    def _row(self, doc_id: str) -> tuple[int, int, int]:
+        row = self._conn.execute(
+            "SELECT version, size, snapshot_version FROM documents "
+            "WHERE doc_id = ?",
+            (doc_id,),
+        ).fetchone()
+        if row is None:
+            raise KeyError(doc_id)
+        return row
+
+    def list_ids(self) -> list[str]:
+        rows = self._conn.execute(
+            "SELECT doc_id FROM documents ORDER BY rowid"
+        ).fetchall()
+        return [doc_id for (doc_id,) in rows]
+
+    def exists(self, doc_id: str) -> bool:
+        try:
+            self._row(doc_id)
+        except KeyError:
+            return False
+        return True
+
+    def version(self, doc_id: str) -> int:
+        return self._row(doc_id)[0]
+
+    def size(self, doc_id: str) -> int:
+        return self._row(doc_id)[1]
+
+    def lines(self, doc_id: str) -> int:
+        size = self.size(doc_id)
+        (newlines,) = self._conn.execute(
+            "SELECT newlines FROM documents WHERE doc_id = ?", (doc_id,)
+        ).fetchone()
+        if newlines is None:
+            newlines = self.read(doc_id).count("\n")
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE documents SET newlines = ? WHERE doc_id = ?",
+                    (newlines, doc_id),
+                )
+        return line_count(size, newlines)
+
+    def _cache_get(self, doc_id: str, version: int) -> Optional[str]:
+        cached = self._cache.get(doc_id)
+        if cached is None or cached[0] != version:
+            return None
+        self._cache.move_to_end(doc_id)
+        return cached[1]
+
+    def _cache_put(self, doc_id: str, version: int, content: str):
+        if doc_id in self._cache:
+            self._cached_chars -= len(self._cache.pop(doc_id)[1])
+        if len(content) > self.cache_chars:
+            return
+        self._cache[doc_id] = (version, content)
+        self._cached_chars += len(content)
+        while self._cached_chars > self.cache_chars:
+            _, (_, evicted) = self._cache.popitem(last=False)
+            self._cached_chars -= len(evicted)
+
+    def read_version(self, doc_id: str, version: int) -> str:
+        """Materializes any stored version of a document."""
+        snapshot = self._conn.execute(
+            "SELECT version, payload FROM revisions WHERE doc_id = ? "
+            "AND kind = 'snapshot' AND version <= ? "
+            "ORDER BY version DESC LIMIT 1",
+            (doc_id, version),
+        ).fetchone()
+        if snapshot is None:
+            raise KeyError(doc_id)
+
+        snapshot_version, content = snapshot
+        patches = self._conn.execute(
+            "SELECT payload FROM revisions WHERE doc_id = ? "
+            "AND version > ? AND version <= ? ORDER BY version",
+            (doc_id, snapshot_version, version),
+        )
+        for (payload,) in patches:
+            content = apply_spans(content, json.loads(payload))
+        return content
+
+    def contents(self) -> Iterator[tuple[str, str]]:
+        for doc_id in self.list_ids():
+            version = self.version(doc_id)
+            content = self._cache_get(doc_id, version)
+            if content is None:
+                content = self.read_version(doc_id, version)
+            yield doc_id, content
+
+    def read(self, doc_id: str) -> str:
+        version = self.version(doc_id)
+        content = self._cache_get(doc_id, version)
+        if content is None:
+            content = self.read_version(doc_id, version)
+            self._cache_put(doc_id, version, content)
+        return content
+
+    def put(self, doc_id: str, content: str) -> int:
+        version = self.version(doc_id) + 1 if self.exists(doc_id) else 1
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO revisions VALUES (?, ?, 'snapshot', ?)",
+                (doc_id, version, content),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents "
+                "(doc_id, version, size, snapshot_version, newlines) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (doc_id, version, len(content), version, content.count("\n")),
+            )
+        self._cache_put(doc_id, version, content)
+        return version
+
+    def apply(self, doc_id: str, spans: list[Span]) -> int:
+        return self.apply_many({doc_id: spans})[doc_id]
+
+    def apply_many(self, changes: dict[str, list[Span]]) -> dict[str, int]:
+        written = {}
+        with self._conn:
+            for doc_id, spans in changes.items():
+                written[doc_id] = self._write_patch(doc_id, spans)
+
+        for doc_id, (version, content) in written.items():
+            if content is not None:
+                self._cache_put(doc_id, version, content)
+        return {doc_id: version for doc_id, (version, _) in written.items()}
+
+    def _write_patch(
+        self, doc_id: str, spans: list[Span]
+    ) -> tuple[int, Optional[str]]:
+        """Writes one version inside the caller's transaction, returning
+        it and the new content if it was cheap to compute."""
+        version, size, snapshot_version = self._row(doc_id)
+        new_version = version + 1
+        cached = self._cache_get(doc_id, version)
+        new_content = apply_spans(cached, spans) if cached is not None else None
+        new_size = size + sum(
+            len(replacement) - (end - start) for start, end, replacement in spans
+        )
+        (newlines,) = self._conn.execute(
+            "SELECT newlines FROM documents WHERE doc_id = ?", (doc_id,)
+        ).fetchone()
+        if newlines is not None and cached is not None:
+            newlines += newline_delta(cached, spans)
+        else:
+            newlines = None
+
+        if new_version - snapshot_version >= self.snapshot_every:
+            if new_content is None:
+                new_content = apply_spans(self.read(doc_id), spans)
+            self._conn.execute(
+                "INSERT INTO revisions VALUES (?, ?, 'snapshot', ?)",
+                (doc_id, new_version, new_content),
+            )
+            snapshot_version = new_version
+        else:
+            self._conn.execute(
+                "INSERT INTO revisions VALUES (?, ?, 'patch', ?)",
+                (doc_id, new_version, json.dumps(spans)),
+            )
+        self._conn.execute(
+            "UPDATE documents SET version = ?, size = ?, "
+            "snapshot_version = ?, newlines = ? WHERE doc_id = ?",
+            (new_version, new_size, snapshot_version, newlines, doc_id),
+        )
+        return new_version, new_content
+
+
+def open_store(path: Optional[str] = None) -> DocumentStore:
+    """SQLite store at `path`, or an in-memory store if no path is given."""
+    if path:
+        return SQLiteDocumentStore(path)
+    return InMemoryDocumentStore()
@@ -1,20 +1,68 @@
+import time
+
+# Taken before anything else is imported, for --profile-startup
+startup_began = time.perf_counter()
+
+import argparse
 import asyncio
+import math
 import sys
 import os
-from dotenv import load_dotenv
 from contextlib import AsyncExitStack
+from typing import Optional
 
-from mcp_client import MCPClient
-from core.claude import Claude
+from core.startup import StartupProfile
 
-from core.cli_chat import CliChat
-from core.cli import CliApp
+# prompt_toolkit and anthropic are left out on purpose: the first is
+# imported while the servers start and the second, which takes longest,
+# only once the prompt is up, while the user types.
+startup = StartupProfile(startup_began)
+with startup.phase("import dotenv"):
+    from dotenv import load_dotenv
+with startup.phase("import mcp, pydantic"):
+    from mcp_client import MCPClient
+with startup.phase("import core"):
+    from core.claude import Claude
+    from core.cli_chat import CliChat
+    from core.compaction import ConversationCompactor
+    from core.journal import SessionJournal, list_sessions, session_path
+    from core.metrics import metrics
+    from core.retrieval import ChunkIndex
+    from core.tracing import tracer
 
 load_dotenv()
 
 # Anthropic Config
 claude_model = os.getenv("CLAUDE_MODEL", "")
 anthropic_api_key = os.getenv("ANTHROPIC_API_KEY", "")
+# Estimated tokens of history kept before older turns are compacted;
+# 0 disables compaction.
+context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "150000"))
+# Memoize read-only tool results and the prompt list (see MCPClient)
+memoize_mcp = os.getenv("MCP_MEMOIZE", "0") == "1"
+# Estimated tokens of relevant document excerpts added to each query;
+# 0 disables retrieval.
+retrieval_token_budget = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "2000"))
+# "input,output" USD per million tokens, to estimate cost in /stats
+claude_price = os.getenv("CLAUDE_PRICE_PER_MTOK", "")
+
+
+def parse_price(value: str) -> Optional[tuple[float, float]]:
+    if not value:
+        return None
+    try:
+        input_price, output_price = map(float, value.split(","))
+    except ValueError:
+        input_price = output_price = -1.0
+    if not (0 <= input_price < math.inf and 0 <= output_price < math.inf):
+        sys.exit(
+            f"Error: CLAUDE_PRICE_PER_MTOK must be two prices, input and "
+            f'output USD per million tokens, such as "3,15"; got "{value}".'
+        )
+    return input_price, output_price
+
+
+price_per_mtok = parse_price(claude_price)
 
 
 assert claude_model, "Error: CLAUDE_MODEL cannot be empty. Update .env"
@@ -23,40 +71,257 @@ assert anthropic_api_key, (
 )
 
 
-async def main():
-    claude_service = Claude(model=claude_model)
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="MCP Chat")
+    parser.add_argument(
+        "server_scripts",
+        nargs="*",
+        help="Additional MCP server scripts to connect to",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Print a per-server startup timing breakdown",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep MCP servers running between launches (see mcp_daemon.py)",
+    )
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="Host the document server in this process instead of "
+        "a subprocess",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Append tracing spans to FILE as JSON lines "
+        "(summarize with trace_report.py)",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="FILE",
+        help="Write session metrics to FILE after every turn, as JSON if "
+        "it ends in .json and in Prometheus text format otherwise",
+    )
+    sessions = parser.add_mutually_exclusive_group()
+    sessions.add_argument(
+        "--resume",
+        metavar="SESSION",
+        help="Continue a saved session ('latest' for the most recent; "
+        "list them with sessions.py)",
+    )
+    sessions.add_argument(
+        "--no-journal",
+        action="store_true",
+        help="Don't save this session",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Print how long each import and startup step took, then exit "
+        "instead of showing the prompt",
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=30.0,
+        help="Seconds to wait for each MCP server to start",
+    )
+    return parser.parse_args()
 
-    server_scripts = sys.argv[1:]
-    clients = {}
 
+async def connect_client(
+    client_id: str, client: MCPClient, timeout: float
+) -> float | None:
+    """Connects a client, returning the time taken or None on failure."""
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(client.connect(), timeout)
+    except asyncio.TimeoutError:
+        print(f"Skipping {client_id}: no response within {timeout}s")
+        return None
+    except Exception as e:
+        print(f"Skipping {client_id}: {e}")
+        return None
+    return time.perf_counter() - start
+
+
+def create_clients(
+    server_scripts: list[str], daemon: bool = False, in_process: bool = False
+) -> dict[str, MCPClient]:
     command, args = (
         ("uv", ["run", "mcp_server.py"])
         if os.getenv("USE_UV", "0") == "1"
         else ("python", ["mcp_server.py"])
     )
+    # The subprocess only inherits a minimal environment
+    doc_store_path = os.getenv("DOC_STORE_PATH")
+    env = {"DOC_STORE_PATH": doc_store_path} if doc_store_path else None
 
-    async with AsyncExitStack() as stack:
-        doc_client = await stack.enter_async_context(
-            MCPClient(command=command, args=args)
+    server = None
+    if in_process:
+        # Imported here so the stdio path doesn't load the document store
+        from mcp_server import mcp as server
+
+    clients = {
+        "doc_client": MCPClient(
+            command=command,
+            args=args,
+            env=env,
+            daemon=daemon and not in_process,
+            memoize=memoize_mcp,
+            server=server,
+        )
+    }
+    for i, server_script in enumerate(server_scripts):
+        client_id = f"client_{i}_{server_script}"
+        clients[client_id] = MCPClient(
+            command="uv",
+            args=["run", server_script],
+            daemon=daemon,
+            memoize=memoize_mcp,
         )
-        clients["doc_client"] = doc_client
+    return clients
 
-        for i, server_script in enumerate(server_scripts):
-            client_id = f"client_{i}_{server_script}"
-            client = await stack.enter_async_context(
-                MCPClient(command="uv", args=["run", server_script])
-            )
+
+async def connect_clients(
+    pending: dict[str, MCPClient],
+    stack: AsyncExitStack,
+    timeout: float,
+    print_timings: bool = False,
+) -> dict[str, MCPClient]:
+    """Connects all clients concurrently, returning those that connected.
+
+    Each connected client is cleaned up when the stack closes.
+    """
+    startup = time.perf_counter()
+    timings = await asyncio.gather(
+        *(
+            connect_client(client_id, client, timeout)
+            for client_id, client in pending.items()
+        )
+    )
+    clients = {}
+    for (client_id, client), elapsed in zip(pending.items(), timings):
+        if elapsed is not None:
+            stack.push_async_callback(client.cleanup)
             clients[client_id] = client
 
+    if print_timings:
+        for client_id, elapsed in zip(pending, timings):
+            status = f"{elapsed:.2f}s" if elapsed is not None else "failed"
+            print(f"  {client_id}: {status}")
+        print(f"  total: {time.perf_counter() - startup:.2f}s")
+    return clients
+
+
+def create_compactor() -> ConversationCompactor | None:
+    if not context_token_budget:
+        return None
+    return ConversationCompactor(budget_tokens=context_token_budget)
+
+
+def open_journal(resume: str | None) -> tuple[str, SessionJournal] | None:
+    """The journal to record the session in, new unless resuming."""
+    if resume == "latest":
+        sessions = list_sessions()
+        if not sessions:
+            print("Error: there is no session to resume.")
+            return None
+        resume = sessions[-1]
+    if resume and not os.path.exists(session_path(resume)):
+        print(f"Error: no session named {resume}.")
+        return None
+    name = resume or time.strftime("%Y%m%d-%H%M%S")
+    if not resume and os.path.exists(session_path(name)):
+        name = f"{name}-{os.getpid()}"
+    return name, SessionJournal(session_path(name))
+
+
+async def main():
+    cli_args = parse_args()
+    if cli_args.trace:
+        tracer.configure(cli_args.trace)
+    if cli_args.metrics:
+        metrics.configure(cli_args.metrics)
+    claude_service = Claude(
+        model=claude_model,
+        price_per_mtok=price_per_mtok,
+    )
+
+    session, journal = None, None
+    if not cli_args.no_journal:
+        opened = open_journal(cli_args.resume)
+        if opened is None:
+            return
+        session, journal = opened
+
+    prompt_imports = asyncio.create_task(
+        asyncio.to_thread(startup.import_modules, ("prompt_toolkit",))
+    )
+
+    async with AsyncExitStack() as stack:
+        with startup.phase("start servers"):
+            clients = await connect_clients(
+                create_clients(
+                    cli_args.server_scripts,
+                    daemon=cli_args.daemon,
+                    in_process=cli_args.in_process,
+                ),
+                stack,
+                timeout=cli_args.connect_timeout,
+                print_timings=cli_args.timings,
+            )
+        if "doc_client" not in clients:
+            print("Error: the document server failed to start.")
+            return
+        doc_client = clients["doc_client"]
+
         chat = CliChat(
             doc_client=doc_client,
             clients=clients,
             claude_service=claude_service,
+            compactor=create_compactor(),
+            journal=journal,
+            retrieval=ChunkIndex() if retrieval_token_budget else None,
+            retrieval_budget_tokens=retrieval_token_budget,
+        )
+        if cli_args.resume:
+            start = time.perf_counter()
+            with startup.phase("load session"):
+                chat.messages = journal.load()
+            print(
+                f"Resumed {session}: {len(chat.messages)} messages"
+                f" in {(time.perf_counter() - start) * 1000:.1f}ms"
+            )
+
+        with startup.phase("create prompt"):
+            await prompt_imports
+            from core.cli import CliApp
+
+            cli = CliApp(chat)
+        with startup.phase("list resources and prompts"):
+            await cli.initialize()
+        startup.mark_ready()
+        model_imports = asyncio.create_task(
+            asyncio.to_thread(startup.import_modules, ("anthropic",))
         )
 
-        cli = CliApp(chat)
-        await cli.initialize()
-        await cli.run()
+        if cli_args.profile_startup:
+            await model_imports
+            print(startup.report())
+            return
+        chat.start_indexing()
+        try:
+            await cli.run()
+        finally:
+            if journal:
+                journal.close()
+                if chat.messages:
+                    print(f"Session saved; continue with --resume {session}")
 
 
 if __name__ == "__main__":
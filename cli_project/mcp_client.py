@@ -1,9 +1,39 @@
+import os
 import sys
+import json
+import time
 import asyncio
-from typing import Optional, Any
+import subprocess
+from typing import Awaitable, Callable, Optional, Any
 from contextlib import AsyncExitStack
+import anyio
 from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
+from mcp.server.fastmcp import FastMCP
+from mcp.shared.exceptions import McpError
+from mcp.shared.memory import create_client_server_memory_streams
+from pydantic import AnyUrl
+
+from socket_transport import (
+    make_private_dir,
+    socket_path_for,
+    unix_socket_client,
+)
+from core.metrics import metrics
+from core.response_cache import ResponseCache
+from core.tracing import payload_size, tracer
+
+DAEMON_SCRIPT = os.path.join(os.path.dirname(__file__), "mcp_daemon.py")
+
+NotificationHandler = Callable[[Any], Awaitable[None]]
+
+_MISSING = object()
+
+
+def _count_cache(cache: str, hit: bool):
+    metrics.counter("mcp_cache_lookups_total", "Client cache lookups").inc(
+        cache=cache, result="hit" if hit else "miss"
+    )
 
 
 class MCPClient:
@@ -12,27 +42,323 @@ class MCPClient:
         command: str,
         args: list[str],
         env: Optional[dict] = None,
+        daemon: bool = False,
+        daemon_spawn_timeout: float = 10.0,
+        memoize: bool = False,
+        memo_ttl: float = 300.0,
+        cache_max_entries: int = 256,
+        cache_max_bytes: int = 32 * 1024 * 1024,
+        read_only_tools: Optional[set[str]] = None,
+        server: Optional[FastMCP] = None,
     ):
         self._command = command
         self._args = args
         self._env = env
+        # Host this server in-process over memory streams instead of
+        # running command as a subprocess.
+        self._server = server
+        # Attach to (or start) a resident mcp_daemon.py for this server
+        # over a Unix socket instead of spawning it over stdio.
+        self._daemon = daemon
+        self._daemon_spawn_timeout = daemon_spawn_timeout
+        self._connection_id = 0
+        self._reconnect_lock = asyncio.Lock()
+        self._notification_handlers: list[NotificationHandler] = []
         self._session: Optional[ClientSession] = None
-        self._exit_stack: AsyncExitStack = AsyncExitStack()
+        self._session_task: Optional[asyncio.Task] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._tools_generation: int = 0
+        # Identical requests in flight share one round trip
+        self._inflight: dict[tuple, asyncio.Task] = {}
+        self.coalesced_requests = 0
+        # Resource contents by URI. Only resources the server accepted a
+        # subscription for are cached, since resources/updated is what
+        # invalidates them.
+        self._resource_cache = ResponseCache(
+            cache_max_entries, cache_max_bytes
+        )
+        self._resource_versions: dict[str, int] = {}
+        self._subscriptions: set[str] = set()
+        self._subscriptions_supported = True
+        self.resource_cache_hits = 0
+        self.resource_cache_misses = 0
+        # Opt-in memoization of read-only tool results, the prompt list,
+        # and resources the server won't notify about, for memo_ttl
+        # seconds. Cleared on any resource or tool notification and after
+        # any call to a tool that isn't read-only.
+        self._memoize = memoize
+        self._memo_ttl = memo_ttl
+        self._memo = ResponseCache(cache_max_entries, cache_max_bytes)
+        self._memo_epoch = 0
+        self.memo_hits = 0
+        self.memo_misses = 0
+        # Tools declared read-only here or by the server's readOnlyHint
+        self._configured_read_only_tools = set(read_only_tools or ())
+        self._read_only_tools = set(self._configured_read_only_tools)
 
     async def connect(self):
+        # The transport and session live in a dedicated task. anyio cancel
+        # scopes must be exited by the task that entered them, so this is
+        # what lets several clients connect concurrently (e.g. under
+        # asyncio.gather or wait_for) and still be cleaned up from anywhere.
+        ready = asyncio.get_running_loop().create_future()
+        self._closing = asyncio.Event()
+        self._session_task = asyncio.create_task(self._run_session(ready))
+        try:
+            await ready
+        except BaseException:
+            await self.cleanup()
+            raise
+
+    async def _run_session(self, ready: asyncio.Future):
+        try:
+            async with AsyncExitStack() as stack:
+                _stdio, _write = await self._open_transport(stack)
+                session = await stack.enter_async_context(
+                    ClientSession(
+                        _stdio, _write, message_handler=self._handle_message
+                    )
+                )
+                await session.initialize()
+                self._session = session
+                self._connection_id += 1
+                self._tools_generation += 1
+                self._reset_resource_cache()
+                ready.set_result(None)
+
+                await self._closing.wait()
+        except asyncio.CancelledError:
+            ready.cancel()
+        except BaseException as e:
+            if ready.done():
+                raise
+            ready.set_exception(e)
+        finally:
+            self._session = None
+
+    async def _open_transport(self, stack: AsyncExitStack):
+        if self._server:
+            return await self._run_in_process(stack)
+        if self._daemon:
+            return await self._attach_daemon(stack)
+
         server_params = StdioServerParameters(
             command=self._command,
             args=self._args,
             env=self._env,
         )
-        stdio_transport = await self._exit_stack.enter_async_context(
-            stdio_client(server_params)
+        return await stack.enter_async_context(stdio_client(server_params))
+
+    async def _run_in_process(self, stack: AsyncExitStack):
+        client_streams, server_streams = await stack.enter_async_context(
+            create_client_server_memory_streams()
+        )
+        task_group = await stack.enter_async_context(
+            anyio.create_task_group()
         )
-        _stdio, _write = stdio_transport
-        self._session = await self._exit_stack.enter_async_context(
-            ClientSession(_stdio, _write)
+        # Runs before the task group exits, once the session has closed
+        stack.callback(task_group.cancel_scope.cancel)
+        server = self._server._mcp_server
+        task_group.start_soon(
+            server.run,
+            *server_streams,
+            server.create_initialization_options(),
         )
-        await self._session.initialize()
+        return client_streams
+
+    async def _attach_daemon(self, stack: AsyncExitStack):
+        path = socket_path_for(self._command, self._args, self._env)
+        deadline = None
+        while True:
+            try:
+                return await stack.enter_async_context(
+                    unix_socket_client(path)
+                )
+            except (FileNotFoundError, ConnectionRefusedError):
+                # No daemon, or a stale socket left by one that died
+                if deadline is None:
+                    self._spawn_daemon(path)
+                    deadline = time.monotonic() + self._daemon_spawn_timeout
+                elif time.monotonic() > deadline:
+                    raise ConnectionError(
+                        f"MCP daemon did not start listening on {path}"
+                    )
+                await asyncio.sleep(0.02)
+
+    def _spawn_daemon(self, path: str):
+        make_private_dir(os.path.dirname(path))
+        command = [sys.executable, DAEMON_SCRIPT, "--socket", path]
+        if self._env is not None:
+            command += ["--env", json.dumps(self._env)]
+        with open(path + ".log", "ab") as log:
+            subprocess.Popen(
+                command + ["--", self._command, *self._args],
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=log,
+                start_new_session=True,
+            )
+
+    async def reconnect(self):
+        await self.cleanup()
+        await self.connect()
+
+    async def _call(self, method: str, *args):
+        """Calls a ClientSession method, recording its latency."""
+        started = time.perf_counter()
+        try:
+            return await self._call_session(method, *args)
+        except Exception as e:
+            metrics.counter("mcp_errors_total", "Failed MCP requests").inc(
+                method=method, error=type(e).__name__
+            )
+            raise
+        finally:
+            metrics.histogram(
+                "mcp_request_seconds", "MCP request latency"
+            ).observe(time.perf_counter() - started, method=method)
+
+    async def _call_session(self, method: str, *args):
+        """Calls a ClientSession method, reattaching once if the daemon
+        behind the session has gone away (it is respawned on connect)."""
+        connection_id = self._connection_id
+        try:
+            return await getattr(self.session(), method)(*args)
+        except (
+            anyio.ClosedResourceError,
+            anyio.BrokenResourceError,
+            ConnectionError,
+            McpError,
+        ) as e:
+            if not self._daemon or (
+                isinstance(e, McpError)
+                and e.error.code != types.CONNECTION_CLOSED
+            ):
+                raise
+
+        async with self._reconnect_lock:
+            if connection_id == self._connection_id:
+                await self.reconnect()
+        return await getattr(self.session(), method)(*args)
+
+    def add_notification_handler(self, handler: NotificationHandler):
+        """Registers a coroutine called with every server notification."""
+        self._notification_handlers.append(handler)
+
+    @property
+    def tools_generation(self) -> int:
+        """Bumped on every (re)connect and tools/list_changed notification."""
+        return self._tools_generation
+
+    async def _handle_message(self, message) -> None:
+        if not isinstance(message, types.ServerNotification):
+            return
+        notification = message.root
+        if isinstance(notification, types.ToolListChangedNotification):
+            self._tools_generation += 1
+            self._clear_memo()
+        elif isinstance(notification, types.ResourceUpdatedNotification):
+            self._invalidate_resource(str(notification.params.uri))
+            self._clear_memo()
+        elif isinstance(notification, types.ResourceListChangedNotification):
+            # Every cached URI, and any being read right now, so the read
+            # isn't cached when it lands
+            uris = {*self._resource_cache.keys(), *self._resource_versions}
+            uris.update(
+                key[1] for key in self._inflight if key[0] == "read_resource"
+            )
+            for uri in uris:
+                self._invalidate_resource(uri)
+            self._clear_memo()
+        elif isinstance(notification, types.PromptListChangedNotification):
+            self._memo.pop(("prompts",))
+
+        for handler in list(self._notification_handlers):
+            await handler(notification)
+
+    def _reset_resource_cache(self):
+        self._resource_cache.clear()
+        self._subscriptions.clear()
+        self._subscriptions_supported = True
+        self._clear_memo()
+
+    def _invalidate_resource(self, uri: str):
+        self._resource_cache.pop(uri)
+        self._resource_versions[uri] = self._resource_versions.get(uri, 0) + 1
+
+    def _clear_memo(self):
+        self._memo.clear()
+        self._memo_epoch += 1
+
+    def _single_flight(
+        self, key: tuple, call: Callable[[], Awaitable[Any]]
+    ) -> Awaitable[Any]:
+        """Joins an identical request already in flight, or starts one.
+
+        The request runs in its own task, so a caller that is cancelled
+        doesn't fail the others waiting on the same result. Keys include
+        the memo epoch, so a request made after a write or notification
+        never joins one that may have read the state before it.
+        """
+        key = (*key, self._memo_epoch)
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced_requests += 1
+            metrics.counter(
+                "mcp_coalesced_requests_total",
+                "Requests that joined an identical one in flight",
+            ).inc()
+        else:
+            task = asyncio.ensure_future(call())
+            self._inflight[key] = task
+
+            def done(task: asyncio.Task):
+                if self._inflight.get(key) is task:
+                    del self._inflight[key]
+                if not task.cancelled():
+                    # Retrieved here in case every caller was cancelled
+                    task.exception()
+
+            task.add_done_callback(done)
+        return asyncio.shield(task)
+
+    async def _memoized(
+        self, key: tuple, call: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Serves key from the memo when enabled, coalescing misses."""
+        if self._memoize:
+            value = self._memo.get(key, _MISSING)
+            if value is not _MISSING:
+                self.memo_hits += 1
+                _count_cache("memo", hit=True)
+                return value
+            self.memo_misses += 1
+            _count_cache("memo", hit=False)
+
+        async def fetch():
+            epoch = self._memo_epoch
+            value = await call()
+            # Skip caching if something invalidated the memo meanwhile
+            if self._memoize and epoch == self._memo_epoch:
+                self._memo.put(
+                    key, value, payload_size(value), ttl=self._memo_ttl
+                )
+            return value
+
+        return await self._single_flight(key, fetch)
+
+    async def _subscribe(self, uri: str) -> bool:
+        if uri in self._subscriptions:
+            return True
+        if not self._subscriptions_supported:
+            return False
+        try:
+            await self._call("subscribe_resource", AnyUrl(uri))
+        except McpError:
+            self._subscriptions_supported = False
+            return False
+        self._subscriptions.add(uri)
+        return True
 
     def session(self) -> ClientSession:
         if self._session is None:
@@ -42,29 +368,116 @@ class MCPClient:
         return self._session
 
     async def list_tools(self) -> list[types.Tool]:
-        # TODO: Return a list of tools defined by the MCP server
-        return []
+        result = await self._single_flight(
+            ("tools",), lambda: self._call("list_tools")
+        )
+        self._read_only_tools = self._configured_read_only_tools | {
+            tool.name
+            for tool in result.tools
+            if tool.annotations and tool.annotations.readOnlyHint
+        }
+        return result.tools
 
     async def call_tool(
         self, tool_name: str, tool_input: dict
     ) -> types.CallToolResult | None:
-        # TODO: Call a particular tool and return the result
-        return None
+        with tracer.span("mcp.call_tool", tool=tool_name) as span:
+            if tool_name in self._read_only_tools:
+                key = (
+                    "tool",
+                    tool_name,
+                    json.dumps(tool_input, sort_keys=True, default=str),
+                )
+                result = await self._memoized(
+                    key, lambda: self._call("call_tool", tool_name, tool_input)
+                )
+            else:
+                try:
+                    result = await self._call(
+                        "call_tool", tool_name, tool_input
+                    )
+                finally:
+                    # It may have changed what read-only tools return
+                    self._clear_memo()
+            if span.recording:
+                span.set(
+                    input_bytes=payload_size(tool_input),
+                    result_bytes=payload_size(result.content),
+                )
+            return result
 
     async def list_prompts(self) -> list[types.Prompt]:
-        # TODO: Return a list of prompts defined by the MCP server
-        return []
+        result = await self._memoized(
+            ("prompts",), lambda: self._call("list_prompts")
+        )
+        return result.prompts
 
-    async def get_prompt(self, prompt_name, args: dict[str, str]):
-        # TODO: Get a particular prompt defined by the MCP server
-        return []
+    async def get_prompt(
+        self, prompt_name, args: dict[str, str]
+    ) -> list[types.PromptMessage]:
+        result = await self._call("get_prompt", prompt_name, args)
+        return result.messages
 
     async def read_resource(self, uri: str) -> Any:
-        # TODO: Read a resource, parse the contents and return it
-        return []
+        with tracer.span("mcp.read_resource", uri=uri) as span:
+            value = await self._read_resource(uri, span)
+            if span.recording:
+                span.set(result_bytes=payload_size(value))
+            return value
+
+    async def _read_resource(self, uri: str, span) -> Any:
+        value = self._resource_cache.get(uri, _MISSING)
+        if value is not _MISSING:
+            self.resource_cache_hits += 1
+            _count_cache("resource", hit=True)
+            span.set(cache_hit=True)
+            return value
+
+        self.resource_cache_misses += 1
+        _count_cache("resource", hit=False)
+        span.set(cache_hit=False)
+        return await self._single_flight(
+            ("read_resource", uri), lambda: self._fetch_resource(uri)
+        )
+
+    async def _fetch_resource(self, uri: str) -> Any:
+        # Subscribe before reading so an update racing the read is seen,
+        # and only cache if nothing invalidated the URI in the meantime.
+        cacheable = await self._subscribe(uri)
+        if not cacheable and self._memoize:
+            return await self._memoized(
+                ("resource", uri), lambda: self._read_resource_value(uri)
+            )
+
+        version = self._resource_versions.get(uri, 0)
+        value = await self._read_resource_value(uri)
+        if cacheable and version == self._resource_versions.get(uri, 0):
+            self._resource_cache.put(uri, value, payload_size(value))
+        return value
+
+    async def _read_resource_value(self, uri: str) -> Any:
+        result = await self._call("read_resource", AnyUrl(uri))
+        resource = result.contents[0]
+
+        if isinstance(resource, types.TextResourceContents):
+            if resource.mimeType == "application/json":
+                value = json.loads(resource.text)
+            else:
+                value = resource.text
+        else:
+            value = resource.blob
+        return value
 
     async def cleanup(self):
-        await self._exit_stack.aclose()
+        task = self._session_task
+        if task is None:
+            return
+        self._session_task = None
+        self._closing.set()
+        if self._session is None:
+            # Still connecting; there is nothing to shut down gracefully
+            task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
         self._session = None
 
     async def __aenter__(self):
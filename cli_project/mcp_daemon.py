@@ -0,0 +1,270 @@
+"""Keeps an MCP server resident behind a Unix-domain socket.
+
+The daemon starts the server once over stdio and proxies every MCP
+session that connects to the socket onto it, so server state survives
+across CLI launches and clients skip the spawn and import cost. It is
+normally started on demand by MCPClient(daemon=True):
+
+    python mcp_daemon.py --socket /tmp/x.sock -- python mcp_server.py
+
+Stop every daemon started from this machine with:
+
+    python mcp_daemon.py --stop-all
+"""
+
+import argparse
+import asyncio
+import fcntl
+import glob
+import json
+import os
+import signal
+import weakref
+
+import anyio
+from mcp import types
+from mcp.server.lowlevel import NotificationOptions, Server
+from mcp.server.session import ServerSession
+
+from mcp_client import MCPClient
+from socket_transport import daemon_dir, make_private_dir, message_streams
+
+# Requests passed through to the upstream server unchanged
+FORWARDED_REQUESTS = {
+    types.ListToolsRequest: types.ListToolsResult,
+    types.CallToolRequest: types.CallToolResult,
+    types.ListResourcesRequest: types.ListResourcesResult,
+    types.ListResourceTemplatesRequest: types.ListResourceTemplatesResult,
+    types.ReadResourceRequest: types.ReadResourceResult,
+    types.ListPromptsRequest: types.ListPromptsResult,
+    types.GetPromptRequest: types.GetPromptResult,
+    types.CompleteRequest: types.CompleteResult,
+}
+
+
+class ProxyServer:
+    def __init__(self, upstream: MCPClient):
+        self.upstream = upstream
+        self.server = Server("mcp-daemon")
+        # Downstream sessions, and the resource URIs each subscribed to
+        self._sessions: weakref.WeakSet[ServerSession] = weakref.WeakSet()
+        self._subscriptions: weakref.WeakKeyDictionary[
+            ServerSession, set[str]
+        ] = weakref.WeakKeyDictionary()
+        # Upstream unsubscribes still in flight
+        self._releases: set[asyncio.Task] = set()
+
+        for request_type, result_type in FORWARDED_REQUESTS.items():
+            self.server.request_handlers[request_type] = self._forward(
+                result_type
+            )
+        self.server.request_handlers[types.SubscribeRequest] = (
+            self._subscribe
+        )
+        self.server.request_handlers[types.UnsubscribeRequest] = (
+            self._unsubscribe
+        )
+        upstream.add_notification_handler(self._on_upstream_notification)
+
+    def _current_session(self) -> ServerSession:
+        session = self.server.request_context.session
+        self._sessions.add(session)
+        return session
+
+    def _forward(self, result_type):
+        async def handler(request):
+            self._current_session()
+            # Rebuild without the JSON-RPC envelope fields the server kept
+            request = type(request)(method=request.method, params=request.params)
+            result = await self.upstream.session().send_request(
+                types.ClientRequest(request), result_type
+            )
+            return types.ServerResult(result)
+
+        return handler
+
+    async def _subscribe(self, request: types.SubscribeRequest):
+        session = self._current_session()
+        uri = str(request.params.uri)
+        await self.upstream.session().subscribe_resource(request.params.uri)
+        self._subscriptions.setdefault(session, set()).add(uri)
+        return types.ServerResult(types.EmptyResult())
+
+    async def _unsubscribe(self, request: types.UnsubscribeRequest):
+        session = self._current_session()
+        uri = str(request.params.uri)
+        self._subscriptions.get(session, set()).discard(uri)
+        if not self._subscribed(uri):
+            await self.upstream.session().unsubscribe_resource(
+                request.params.uri
+            )
+        return types.ServerResult(types.EmptyResult())
+
+    def _subscribed(self, uri: str) -> bool:
+        return any(uri in uris for uris in self._subscriptions.values())
+
+    def _release_done(self, task: asyncio.Task):
+        self._releases.discard(task)
+        if not task.cancelled() and task.exception():
+            print(f"Error unsubscribing upstream: {task.exception()}")
+
+    async def _on_upstream_notification(self, notification):
+        if isinstance(
+            notification, types.ResourceUpdatedNotification
+        ) and not self._subscribed(str(notification.params.uri)):
+            # Every subscriber disconnected without unsubscribing. This
+            # runs in the upstream session's receive loop, which must keep
+            # going to deliver the reply, so don't wait for one here.
+            task = asyncio.create_task(
+                self.upstream.session().unsubscribe_resource(
+                    notification.params.uri
+                )
+            )
+            self._releases.add(task)
+            task.add_done_callback(self._release_done)
+            return
+        for session in list(self._sessions):
+            try:
+                if isinstance(notification, types.ResourceUpdatedNotification):
+                    uri = notification.params.uri
+                    if str(uri) in self._subscriptions.get(session, set()):
+                        await session.send_resource_updated(uri)
+                elif isinstance(notification, types.ToolListChangedNotification):
+                    await session.send_tool_list_changed()
+                elif isinstance(
+                    notification, types.ResourceListChangedNotification
+                ):
+                    await session.send_resource_list_changed()
+                elif isinstance(
+                    notification, types.PromptListChangedNotification
+                ):
+                    await session.send_prompt_list_changed()
+            except (anyio.ClosedResourceError, anyio.BrokenResourceError):
+                self._sessions.discard(session)
+
+    async def handle_connection(self, stream):
+        async with message_streams(stream) as (read_stream, write_stream):
+            await self.server.run(
+                read_stream,
+                write_stream,
+                self.server.create_initialization_options(
+                    NotificationOptions(
+                        prompts_changed=True,
+                        resources_changed=True,
+                        tools_changed=True,
+                    )
+                ),
+            )
+
+
+async def watch_upstream(upstream: MCPClient, interval: float = 5.0):
+    """Returns once the upstream server stops answering pings."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.wait_for(upstream.session().send_ping(), interval)
+        except Exception:
+            return
+
+
+def lock_pid_file(pid_path: str) -> int | None:
+    """Locks pid_path and writes our pid to it, or returns None if a live
+    daemon holds it. The lock is released when the process exits."""
+    fd = os.open(pid_path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # Lost a race with a daemon that removed the file as it exited
+        if os.fstat(fd).st_ino != os.stat(pid_path).st_ino:
+            raise BlockingIOError
+    except (BlockingIOError, FileNotFoundError):
+        os.close(fd)
+        return None
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode())
+    return fd
+
+
+async def serve(
+    socket_path: str, command: str, args: list[str], env: dict | None
+):
+    make_private_dir(os.path.dirname(os.path.abspath(socket_path)))
+    pid_path = socket_path + ".pid"
+    # Whoever holds the lock owns the socket, so a socket found without
+    # it was left by a daemon that died and is safe to replace
+    pid_fd = lock_pid_file(pid_path)
+    if pid_fd is None:
+        print(f"A daemon is already serving {socket_path}")
+        return
+
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, asyncio.current_task().cancel
+    )
+    upstream = MCPClient(command=command, args=args, env=env)
+    try:
+        await upstream.connect()
+    except BaseException:
+        os.remove(pid_path)
+        os.close(pid_fd)
+        raise
+    proxy = ProxyServer(upstream)
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    listener = await anyio.create_unix_listener(socket_path)
+
+    try:
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(listener.serve, proxy.handle_connection)
+            # If the server dies, exit so the next client respawns us
+            await watch_upstream(upstream)
+            tg.cancel_scope.cancel()
+    finally:
+        for path in (socket_path, pid_path):
+            if os.path.exists(path):
+                os.remove(path)
+        os.close(pid_fd)
+        await upstream.cleanup()
+
+
+def stop_all():
+    for pid_path in glob.glob(os.path.join(daemon_dir(), "*.sock.pid")):
+        with open(pid_path) as f:
+            pid = int(f.read().strip() or 0)
+        try:
+            os.kill(pid, signal.SIGTERM)
+            print(f"Stopped daemon {pid}")
+        except ProcessLookupError:
+            os.remove(pid_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--socket", help="Unix socket to listen on")
+    parser.add_argument(
+        "--env", help="JSON object of environment variables for the server"
+    )
+    parser.add_argument(
+        "--stop-all", action="store_true", help="Stop all running daemons"
+    )
+    parser.add_argument("server", nargs=argparse.REMAINDER)
+    cli_args = parser.parse_args()
+
+    if cli_args.stop_all:
+        stop_all()
+        return
+
+    server = cli_args.server
+    if server[:1] == ["--"]:
+        server = server[1:]
+    if not cli_args.socket or not server:
+        parser.error("--socket and a server command are required")
+
+    env = json.loads(cli_args.env) if cli_args.env else None
+    try:
+        asyncio.run(serve(cli_args.socket, server[0], server[1:], env))
+    except (asyncio.CancelledError, KeyboardInterrupt):
+        pass
+
+
+if __name__ == "__main__":
+    main()
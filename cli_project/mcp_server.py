@@ -1,9 +1,18 @@
-from mcp.server.fastmcp import FastMCP
+import fnmatch
+import json
+import os
+import re
 
-from pydantic import Field
+from mcp.server.fastmcp import FastMCP, Context
+from mcp.types import ToolAnnotations
+
+from pydantic import AnyUrl, Field
+from document_store import apply_spans, diff_span, find_pattern_spans, find_spans, open_store
+from search_index import InvertedIndex, make_snippet
 mcp = FastMCP("DocumentMCP", log_level="ERROR")
 
 
+# Seed documents, added to the store on startup if they aren't there yet
 docs = {
     "deposition.md": "This deposition covers the testimony of Angela Smith, P.E.",
     "report.pdf": "The report details the state of a 20m condenser tower.",
@@ -13,38 +22,351 @@ docs = {
     "spec.txt": "These specifications define the technical requirements for the equipment.",
 }
 
+# Set DOC_STORE_PATH to keep documents and their history in a SQLite file
+store = open_store(os.getenv("DOC_STORE_PATH"))
+store.seed(docs)
+
+# Built on the first search rather than at startup, then kept up to date
+# by every edit
+index: InvertedIndex | None = None
+
+
+def search_index() -> InvertedIndex:
+    global index
+    if index is None:
+        index = InvertedIndex()
+        for doc_id, content in store.contents():
+            index.update(doc_id, content)
+    return index
+
+
+def reindex(doc_id: str) -> None:
+    """Updates doc_id's postings, if the index has been built yet."""
+    if index is not None:
+        index.update(doc_id, store.read(doc_id))
+
+
+# Lets clients coalesce and memoize calls to tools that don't write
+READ_ONLY = ToolAnnotations(readOnlyHint=True)
+
+# Resource URIs the connected client asked to be notified about
+subscriptions: set[str] = set()
+
+
+@mcp._mcp_server.subscribe_resource()
+async def subscribe_resource(uri: AnyUrl) -> None:
+    subscriptions.add(str(uri))
+
+
+@mcp._mcp_server.unsubscribe_resource()
+async def unsubscribe_resource(uri: AnyUrl) -> None:
+    subscriptions.discard(str(uri))
+
+
+async def notify_document_updated(ctx: Context, doc_id: str) -> None:
+    uri = f"docs://documents/{doc_id}"
+    if uri in subscriptions:
+        await ctx.session.send_resource_updated(AnyUrl(uri))
+
+
+DEFAULT_CHUNK_SIZE = 4000
+
+
+def make_cursor(doc_id: str, version: int, offset: int, chunk_size: int) -> str:
+    return f"{doc_id}@{version}:{offset}:{chunk_size}"
+
+
+def parse_cursor(cursor: str) -> tuple[str, int, int, int]:
+    try:
+        doc_id, position = cursor.rsplit("@", 1)
+        version, offset, chunk_size = map(int, position.split(":"))
+    except ValueError:
+        raise ValueError(f"Invalid cursor '{cursor}'.")
+    if offset < 0 or chunk_size < 1:
+        raise ValueError(f"Invalid cursor '{cursor}'.")
+    return doc_id, version, offset, chunk_size
+
+
+@mcp.tool(name="read_doc_contents", annotations=READ_ONLY, description="Read the contents of a document and return it as a string. For large documents, read only part of it: use offset/length for a character range, start_line/end_line for a line range, or chunk_size to page through it (the result includes a next_cursor to pass back as cursor). Call document_stats first to see how big a document is.")
+def read_documents(doc_id: str = Field(description="Id of the document to read"),
+                   offset: int | None = Field(default=None, ge=0, description="Character offset to start reading at"),
+                   length: int | None = Field(default=None, ge=0, description="Number of characters to read from offset"),
+                   start_line: int | None = Field(default=None, ge=1, description="First line to read (1-based)"),
+                   end_line: int | None = Field(default=None, ge=1, description="Last line to read (inclusive)"),
+                   chunk_size: int | None = Field(default=None, ge=1, description="Read the document in chunks of this many characters"),
+                   cursor: str | None = Field(default=None, description="next_cursor from a previous chunked read")) -> str:
+    if cursor:
+        doc_id, version, offset, cursor_chunk_size = parse_cursor(cursor)
+        chunk_size = chunk_size or cursor_chunk_size
+        if store.exists(doc_id) and store.version(doc_id) != version:
+            raise ValueError(f"Document {doc_id} changed since this cursor was issued; start reading again.")
+
+    if not store.exists(doc_id):
+        raise ValueError(f"Document {doc_id} not found.")
+    content = store.read(doc_id)
+
+    if start_line is not None or end_line is not None:
+        lines = content.splitlines(keepends=True)
+        first = max((start_line or 1) - 1, 0)
+        return "".join(lines[first:end_line])
+
+    if chunk_size is not None or cursor:
+        start = offset or 0
+        chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+        end = min(start + chunk_size, len(content))
+        return json.dumps({
+            "content": content[start:end],
+            "next_cursor": make_cursor(doc_id, store.version(doc_id), end, chunk_size) if end < len(content) else None,
+        })
+
+    if offset is not None or length is not None:
+        start = offset or 0
+        return content[start:start + length if length is not None else None]
+
+    return content
 
 
-@mcp.tool(name="read_doc_contents", description="Read the contents of a document and return it as a string")
-def read_documents(doc_id: str = Field(description="Id of the document to read")) -> str:
-    if doc_id not in docs:
+@mcp.tool(name="document_stats", annotations=READ_ONLY, description="Get a document's size in characters, line count and current version without reading it")
+def document_stats(doc_id: str = Field(description="Id of the document")) -> str:
+    if not store.exists(doc_id):
         raise ValueError(f"Document {doc_id} not found.")
-    return docs[doc_id]
+    return json.dumps({
+        "doc_id": doc_id,
+        "size": store.size(doc_id),
+        "lines": store.lines(doc_id),
+        "version": store.version(doc_id),
+    })
 
-@mcp.tool(name="edit_document", description="Edit a document by replacing a string in the documents contents")
-def edit_document(doc_id: str = Field(description="Id of the document to edit"),
-                  old_string: str = Field(description="The string to replace"),
-                  new_string: str = Field(description="The string to replace with")) -> str:
+# Context shown around each change: the rest of its line, up to this many
+# characters either side
+DIFF_CONTEXT_CHARS = 80
+# Changes listed in an edit's diff; the rest are only counted
+DIFF_MAX_HUNKS = 10
+
+
+def edit_diff(doc_id: str, before: str, spans: list, old_version: int, new_version: int) -> str:
+    """A unified-style diff of the spans an edit replaced, each shown with
+    the rest of its line(s). Hunk headers give character offsets in the
+    old and new versions. Only the text around each span is looked at,
+    so this costs O(edit), not O(document)."""
+    hunks = []  # [context start, context end, spans]
+    for span in spans:
+        start, end, _ = span
+        context_start = max(before.rfind("\n", 0, start) + 1, start - DIFF_CONTEXT_CHARS)
+        context_end = before.find("\n", end, end + DIFF_CONTEXT_CHARS)
+        if context_end == -1:
+            context_end = min(end + DIFF_CONTEXT_CHARS, len(before))
+        if hunks and context_start <= hunks[-1][1]:
+            hunks[-1][1] = context_end
+            hunks[-1][2].append(span)
+        else:
+            hunks.append([context_start, context_end, [span]])
+
+    lines = [f"--- {doc_id} (version {old_version})", f"+++ {doc_id} (version {new_version})"]
+    shift = 0
+    for number, (context_start, context_end, hunk_spans) in enumerate(hunks):
+        old = before[context_start:context_end]
+        new = apply_spans(old, [(start - context_start, end - context_start, text) for start, end, text in hunk_spans])
+        if number < DIFF_MAX_HUNKS:
+            lines.append(f"@@ -{context_start} +{context_start + shift} @@")
+            lines += [f"-{line}" for line in old.split("\n")]
+            lines += [f"+{line}" for line in new.split("\n")]
+        shift += len(new) - len(old)
+    if len(hunks) > DIFF_MAX_HUNKS:
+        lines.append(f"... and {len(hunks) - DIFF_MAX_HUNKS} more changes")
+    return "\n".join(lines)
+
+
+@mcp.tool(name="edit_document", description="Edit a document by replacing a string in the documents contents. Returns the new version and a diff of each change with its surrounding line and character offset; set return_full to get the whole edited document instead.")
+async def edit_document(ctx: Context,
+                        doc_id: str = Field(description="Id of the document to edit"),
+                        old_string: str = Field(description="The string to replace"),
+                        new_string: str = Field(description="The string to replace with"),
+                        return_full: bool = Field(default=False, description="Return the full edited document instead of a diff")) -> str:
     """Edit a document by replacing old_string with new_string."""
-    if doc_id not in docs:
+    if not store.exists(doc_id):
         raise ValueError(f"Document {doc_id} not found.")
 
-    if old_string not in docs[doc_id]:
+    before = store.read(doc_id)
+    spans = find_spans(before, old_string, new_string)
+    occurrences = len(spans)
+    if not occurrences:
         raise ValueError(f"String '{old_string}' not found in document {doc_id}.")
 
-    docs[doc_id] = docs[doc_id].replace(old_string, new_string)
-    result = docs[doc_id]
+    old_version = store.version(doc_id)
+    new_version = store.apply(doc_id, spans)
+    reindex(doc_id)
+    await notify_document_updated(ctx, doc_id)
+
+    if return_full:
+        return store.read(doc_id)
+    summary = f"Replaced {occurrences} occurrence{'s' if occurrences > 1 else ''} in {doc_id}; now version {new_version}."
+    return f"{summary}\n{edit_diff(doc_id, before, spans, old_version, new_version)}"
+
+
+@mcp.tool(name="read_many_documents", annotations=READ_ONLY, description="Read several documents in one call. Returns a JSON list with each document's doc_id, version and content (or an error if it doesn't exist). Use max_chars to read only the start of each document.")
+def read_many_documents(doc_ids: list[str] = Field(description="Ids of the documents to read"),
+                        max_chars: int | None = Field(default=None, ge=0, description="Read at most this many characters of each document")) -> str:
+    results = []
+    for doc_id in doc_ids:
+        if not store.exists(doc_id):
+            results.append({"doc_id": doc_id, "error": "not found"})
+            continue
+        content = store.read(doc_id)
+        result = {"doc_id": doc_id, "version": store.version(doc_id), "content": content[:max_chars]}
+        if max_chars is not None and len(content) > max_chars:
+            result["truncated_from"] = len(content)
+        results.append(result)
+    return json.dumps(results)
+
+
+async def commit_changes(ctx: Context, changes: dict[str, list], counts: dict[str, int]) -> list[dict]:
+    """Applies span changes to several documents atomically, then updates
+    the index and subscribers. Returns compact per-document statuses."""
+    versions = store.apply_many(changes)
+    for doc_id in changes:
+        reindex(doc_id)
+        await notify_document_updated(ctx, doc_id)
+    return [
+        {"doc_id": doc_id, "replacements": counts[doc_id], "version": version}
+        for doc_id, version in versions.items()
+    ]
+
+
+@mcp.tool(name="batch_edit_documents", description="Apply a list of string replacements across any number of documents in one atomic change: either every edit applies or none do. Edits to the same document apply in order. Returns each changed document's replacement count and new version, not its contents.")
+async def batch_edit_documents(ctx: Context,
+                               edits: list[dict[str, str]] = Field(description="Edits, each an object with doc_id, old_string and new_string")) -> str:
+    originals: dict[str, str] = {}
+    contents: dict[str, str] = {}
+    counts: dict[str, int] = {}
+    problems = []
+    for number, edit in enumerate(edits, start=1):
+        doc_id, old_string, new_string = edit.get("doc_id"), edit.get("old_string"), edit.get("new_string")
+        if not doc_id or not old_string or new_string is None:
+            problems.append(f"edit {number}: doc_id, old_string and new_string are required")
+            continue
+        if doc_id not in contents:
+            if not store.exists(doc_id):
+                problems.append(f"edit {number}: document {doc_id} not found")
+                continue
+            originals[doc_id] = contents[doc_id] = store.read(doc_id)
+        occurrences = contents[doc_id].count(old_string)
+        if not occurrences:
+            problems.append(f"edit {number}: '{old_string}' not found in {doc_id}")
+            continue
+        contents[doc_id] = contents[doc_id].replace(old_string, new_string)
+        counts[doc_id] = counts.get(doc_id, 0) + occurrences
+    if problems:
+        raise ValueError("No edits were applied. " + "; ".join(problems))
+
+    changes = {}
+    for doc_id, content in contents.items():
+        single = [edit for edit in edits if edit["doc_id"] == doc_id]
+        if len(single) == 1:
+            changes[doc_id] = find_spans(originals[doc_id], single[0]["old_string"], single[0]["new_string"])
+        else:
+            changes[doc_id] = diff_span(originals[doc_id], content)
+    return json.dumps(await commit_changes(ctx, changes, counts))
+
+
+@mcp.tool(name="find_replace_documents", description="Find and replace a pattern across many documents in one atomic change. Choose documents with doc_ids and/or a doc_id_glob such as '*.md' or '*spec*' (all documents if neither is given). Set regex to use a regular expression (replacement may use \\1 group references). Use dry_run to only count matches. Returns replacement counts and new versions for the documents that matched.")
+async def find_replace_documents(ctx: Context,
+                                 pattern: str = Field(description="Text (or regular expression) to find"),
+                                 replacement: str = Field(description="Text to replace each match with"),
+                                 doc_ids: list[str] | None = Field(default=None, description="Only these documents"),
+                                 doc_id_glob: str | None = Field(default=None, description="Only documents whose id matches this glob"),
+                                 regex: bool = Field(default=False, description="Treat pattern as a regular expression"),
+                                 case_sensitive: bool = Field(default=True, description="Match case"),
+                                 dry_run: bool = Field(default=False, description="Count matches without changing anything")) -> str:
+    try:
+        compiled = re.compile(pattern if regex else re.escape(pattern), 0 if case_sensitive else re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f"Invalid pattern: {e}")
+    if not regex:
+        # A literal replacement, so backslashes are not group references
+        replacement = replacement.replace("\\", "\\\\")
+
+    targets = doc_ids if doc_ids is not None else store.list_ids()
+    missing = [doc_id for doc_id in targets if not store.exists(doc_id)]
+    if missing:
+        raise ValueError(f"Documents not found: {', '.join(missing)}")
+    if doc_id_glob:
+        targets = [doc_id for doc_id in targets if fnmatch.fnmatch(doc_id, doc_id_glob)]
+
+    changes = {}
+    for doc_id in targets:
+        try:
+            spans = find_pattern_spans(store.read(doc_id), compiled, replacement)
+        except (re.error, IndexError) as e:
+            raise ValueError(f"Invalid replacement: {e}")
+        if spans:
+            changes[doc_id] = spans
+    counts = {doc_id: len(spans) for doc_id, spans in changes.items()}
+
+    if dry_run:
+        documents = [{"doc_id": doc_id, "matches": count} for doc_id, count in counts.items()]
+    else:
+        documents = await commit_changes(ctx, changes, counts)
+    return json.dumps({
+        "searched": len(targets),
+        "changed": 0 if dry_run else len(changes),
+        "replacements": sum(counts.values()),
+        "documents": documents,
+    })
+
+
+@mcp.tool(name="search_documents", annotations=READ_ONLY, description="Search all documents for the given words. Returns matching doc_ids ranked by relevance (BM25), each with a short snippet where matches are in **bold**. Use it to find which documents to read.")
+def search_documents(query: str = Field(description="Words to search for"),
+                     limit: int = Field(default=5, description="Maximum number of results")) -> str:
+    return json.dumps([
+        {
+            "doc_id": doc_id,
+            "score": round(score, 3),
+            "snippet": make_snippet(store.read(doc_id), query),
+        }
+        for doc_id, score in search_index().search(query, limit)
+    ])
+
+
+@mcp.resource("docs://documents", mime_type="application/json")
+def list_docs() -> list[str]:
+    return store.list_ids()
+
+
+@mcp.resource("docs://documents/{doc_id}", mime_type="text/plain")
+def fetch_doc(doc_id: str) -> str:
+    if not store.exists(doc_id):
+        raise ValueError(f"Document {doc_id} not found.")
+    return store.read(doc_id)
+
+
+@mcp.prompt(name="format", description="Rewrites the contents of the document in Markdown format.")
+def format_document(doc_id: str = Field(description="Id of the document to format")) -> str:
+    return f"""
+    Your goal is to reformat a document to be written with markdown syntax.
+
+    The id of the document you need to reformat is:
+    <document_id>
+    {doc_id}
+    </document_id>
+
+    Add in headers, bullet points, tables, etc as necessary. Feel free to add in extra text, but don't change the meaning of the report.
+    Use the 'edit_document' tool to edit the document. After the document has been edited, respond with the final version of the doc. Don't explain your changes.
+    """
 
-    # Ensure we always return a string
-    return result if result is not None else ""
 
-    
+@mcp.prompt(name="summarize", description="Summarizes the contents of the document.")
+def summarize_document(doc_id: str = Field(description="Id of the document to summarize")) -> str:
+    return f"""
+    Your goal is to summarize the contents of a document.
 
+    The id of the document you need to summarize is:
+    <document_id>
+    {doc_id}
+    </document_id>
 
-# TODO: Write a resource to return all doc id's
-# TODO: Write a resource to return the contents of a particular doc
-# TODO: Write a prompt to rewrite a doc in markdown format
-# TODO: Write a prompt to summarize a doc
+    Read the document with the 'read_doc_contents' tool, then write a concise summary of it.
+    """
 
 
 if __name__ == "__main__":
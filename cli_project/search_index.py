@@ -0,0 +1,98 @@
+import math
+import re
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return [token.lower() for token in TOKEN_PATTERN.findall(text)]
+
+
+class InvertedIndex:
+    """In-memory inverted index with BM25 ranking.
+
+    Documents are indexed one at a time with update(), which swaps out
+    only that document's postings, so edits never require a rebuild.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # term -> {doc_id: term frequency}
+        self._postings: dict[str, dict[str, int]] = {}
+        self._doc_terms: dict[str, Counter] = {}
+        self._doc_lengths: dict[str, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def remove(self, doc_id: str):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+
+    def update(self, doc_id: str, text: str):
+        self.remove(doc_id)
+        terms = Counter(tokenize(text))
+        self._doc_terms[doc_id] = terms
+        self._doc_lengths[doc_id] = sum(terms.values())
+        self._total_length += self._doc_lengths[doc_id]
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = frequency
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[str, float]]:
+        """Returns (doc_id, score) pairs, best first."""
+        doc_count = len(self._doc_terms)
+        if not doc_count:
+            return []
+        average_length = self._total_length / doc_count
+
+        scores: dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(
+                1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            for doc_id, frequency in postings.items():
+                length = self._doc_lengths[doc_id]
+                norm = self.k1 * (
+                    1 - self.b + self.b * length / average_length
+                )
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * (
+                    frequency * (self.k1 + 1) / (frequency + norm)
+                )
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+
+def make_snippet(text: str, query: str, width: int = 160) -> str:
+    """A window of text around the first query term, terms in **bold**."""
+    terms = set(tokenize(query))
+    if not terms:
+        return text[:width]
+
+    pattern = re.compile(
+        r"\b(" + "|".join(re.escape(term) for term in terms) + r")\b",
+        re.IGNORECASE,
+    )
+    match = pattern.search(text)
+    start = max(match.start() - width // 3, 0) if match else 0
+    end = min(start + width, len(text))
+
+    snippet = pattern.sub(r"**\1**", text[start:end]).replace("\n", " ")
+    if start > 0:
+        snippet = "..." + snippet
+    if end < len(text):
+        snippet += "..."
+    return snippet
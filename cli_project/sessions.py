@@ -0,0 +1,50 @@
+"""Lists and compacts the session journals written by main.py.
+
+    python sessions.py list
+    python sessions.py compact [--min-bytes N] [SESSION ...]
+
+A journal only grows: every message is appended, and the conversation is
+snapshotted whenever it is compacted and every few hundred messages.
+`compact` rewrites each journal (all of them by default) as a single
+snapshot of the current conversation. Don't compact a session that is
+still open in main.py; its later messages would be lost.
+"""
+
+import argparse
+import os
+
+from core.journal import compact_journal, list_sessions, session_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List sessions, oldest first")
+    compact = commands.add_parser("compact", help="Rewrite journals")
+    compact.add_argument("sessions", nargs="*", metavar="SESSION")
+    compact.add_argument(
+        "--min-bytes",
+        type=int,
+        default=0,
+        help="Skip journals smaller than this",
+    )
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for name in list_sessions():
+            print(f"{name:<32}{os.path.getsize(session_path(name)):>12,} B")
+        return
+
+    for name in args.sessions or list_sessions():
+        path = session_path(name)
+        if not os.path.exists(path):
+            print(f"Skipping {name}: no such session")
+            continue
+        if os.path.getsize(path) < args.min_bytes:
+            continue
+        before, after = compact_journal(path)
+        print(f"{name}: {before:,} -> {after:,} bytes")
+
+
+if __name__ == "__main__":
+    main()
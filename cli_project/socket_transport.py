@@ -0,0 +1,119 @@
+import hashlib
+import json
+import os
+import stat
+import tempfile
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import anyio
+from anyio.abc import ByteStream
+from anyio.streams.buffered import BufferedByteReceiveStream
+from anyio.streams.memory import (
+    MemoryObjectReceiveStream,
+    MemoryObjectSendStream,
+)
+from mcp import types
+from mcp.shared.message import SessionMessage
+
+# Largest single JSON-RPC message accepted over a socket
+MAX_MESSAGE_BYTES = 256 * 1024 * 1024
+
+ReadStream = MemoryObjectReceiveStream[SessionMessage | Exception]
+WriteStream = MemoryObjectSendStream[SessionMessage]
+
+
+def daemon_dir() -> str:
+    """Where mcp_daemon.py sockets, pid files and logs live."""
+    return os.getenv("MCP_DAEMON_DIR") or os.path.join(
+        tempfile.gettempdir(), f"mcp-chat-{os.getuid()}"
+    )
+
+
+def make_private_dir(path: str):
+    """Creates path readable only by this user, refusing to use one that
+    someone else created (or made accessible) first."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o077
+    ):
+        raise PermissionError(
+            f"{path} must be a directory owned by this user with mode 0700"
+        )
+
+
+def socket_path_for(
+    command: str, args: list[str], env: Optional[dict] = None
+) -> str:
+    """One socket per server command line and working directory."""
+    key = json.dumps([os.getcwd(), command, args, env], sort_keys=True)
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(daemon_dir(), f"{digest}.sock")
+
+
+@asynccontextmanager
+async def message_streams(
+    stream: ByteStream,
+) -> AsyncIterator[tuple[ReadStream, WriteStream]]:
+    """Newline-delimited JSON-RPC over a byte stream, as with stdio.
+
+    Yields the (read, write) pair that ClientSession and Server.run
+    expect.
+    """
+    read_stream_writer, read_stream = anyio.create_memory_object_stream(0)
+    write_stream, write_stream_reader = anyio.create_memory_object_stream(0)
+
+    async def reader():
+        buffered = BufferedByteReceiveStream(stream)
+        async with read_stream_writer:
+            while True:
+                try:
+                    line = await buffered.receive_until(
+                        b"\n", MAX_MESSAGE_BYTES
+                    )
+                except (
+                    anyio.EndOfStream,
+                    anyio.IncompleteRead,
+                    anyio.ClosedResourceError,
+                    anyio.BrokenResourceError,
+                ):
+                    return
+                try:
+                    message = types.JSONRPCMessage.model_validate_json(line)
+                except Exception as exc:
+                    await read_stream_writer.send(exc)
+                    continue
+                await read_stream_writer.send(SessionMessage(message))
+
+    async def writer():
+        try:
+            async with write_stream_reader:
+                async for session_message in write_stream_reader:
+                    data = session_message.message.model_dump_json(
+                        by_alias=True, exclude_none=True
+                    )
+                    await stream.send(data.encode() + b"\n")
+        except (anyio.ClosedResourceError, anyio.BrokenResourceError):
+            await anyio.lowlevel.checkpoint()
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(reader)
+        tg.start_soon(writer)
+        try:
+            yield read_stream, write_stream
+        finally:
+            tg.cancel_scope.cancel()
+            await stream.aclose()
+
+
+@asynccontextmanager
+async def unix_socket_client(
+    path: str,
+) -> AsyncIterator[tuple[ReadStream, WriteStream]]:
+    """Client transport for a server listening on a Unix-domain socket."""
+    stream = await anyio.connect_unix(path)
+    async with message_streams(stream) as streams:
+        yield streams
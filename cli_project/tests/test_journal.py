@@ -0,0 +1,166 @@
+import os
+
+from core.journal import SessionJournal, compact_journal
+
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+def assistant(text):
+    return {"role": "assistant", "content": [{"type": "text", "text": text}]}
+
+
+def tool_call(tool_id):
+    return {
+        "role": "assistant",
+        "content": [
+            {"type": "tool_use", "id": tool_id, "name": "t", "input": {}}
+        ],
+    }
+
+
+def tool_result(tool_id):
+    return {
+        "role": "user",
+        "content": [
+            {"type": "tool_result", "tool_use_id": tool_id, "content": "ok"}
+        ],
+    }
+
+
+def reopen(path, **kwargs):
+    journal = SessionJournal(path, **kwargs)
+    return journal, journal.load()
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "s.journal")
+    messages = [user("hi"), assistant("hello")]
+    journal, loaded = reopen(path)
+    assert loaded == []
+    journal.append(messages)
+    journal.close()
+
+    journal, loaded = reopen(path)
+    assert loaded == messages
+    journal.close()
+
+
+def test_resume_then_append(tmp_path):
+    path = str(tmp_path / "s.journal")
+    journal, messages = reopen(path)
+    messages += [user("one"), assistant("two")]
+    journal.append(messages)
+    journal.close()
+
+    journal, messages = reopen(path)
+    messages += [user("three"), assistant("four")]
+    journal.append(messages)
+    journal.close()
+
+    _, loaded = reopen(path)
+    assert [m["content"] for m in loaded][::2] == ["one", "three"]
+    assert len(loaded) == 4
+
+
+def test_torn_tail_is_dropped(tmp_path):
+    path = str(tmp_path / "s.journal")
+    journal, messages = reopen(path)
+    messages += [user("one"), assistant("two")]
+    journal.append(messages)
+    journal.close()
+    intact = os.path.getsize(path)
+    with open(path, "ab") as f:
+        f.write(b"\x01\x40\x00\x00\x00garbage")
+
+    journal, loaded = reopen(path)
+    assert len(loaded) == 2
+    assert os.path.getsize(path) == intact
+    loaded.append(user("three"))
+    journal.append(loaded)
+    journal.close()
+
+    _, loaded = reopen(path)
+    assert loaded[-1] == user("three")
+
+
+def test_unanswered_tool_call_is_dropped(tmp_path):
+    path = str(tmp_path / "s.journal")
+    journal, messages = reopen(path)
+    messages += [user("one"), tool_call("a"), tool_result("a"), tool_call("b")]
+    journal.append(messages)
+    journal.close()
+
+    journal, loaded = reopen(path)
+    assert loaded == messages[:3]
+    loaded += [user("two"), assistant("three")]
+    journal.append(loaded)
+    journal.close()
+
+    _, reloaded = reopen(path)
+    assert reloaded == loaded
+
+
+def test_snapshots(tmp_path):
+    path = str(tmp_path / "s.journal")
+    journal, messages = reopen(path, snapshot_every=3)
+    for i in range(4):
+        messages.append(user(str(i)))
+        journal.append(messages)
+    journal.close()
+    assert journal._since_snapshot == 0
+
+    journal, loaded = reopen(path, snapshot_every=3)
+    assert loaded == messages
+    assert journal._since_snapshot == 0
+    loaded.append(user("4"))
+    journal.append(loaded)
+    journal.close()
+
+    journal, loaded = reopen(path, snapshot_every=3)
+    assert journal._since_snapshot == 1
+    journal.close()
+
+
+def test_since_snapshot_without_snapshot(tmp_path):
+    path = str(tmp_path / "s.journal")
+    journal, messages = reopen(path, snapshot_every=3)
+    assert journal._since_snapshot == 0
+    messages += [user("one"), assistant("two")]
+    journal.append(messages)
+    journal.close()
+
+    journal, loaded = reopen(path, snapshot_every=3)
+    assert journal._since_snapshot == 2
+    loaded += [user("three"), assistant("four")]
+    journal.append(loaded)
+    journal.close()
+
+    _, reloaded = reopen(path, snapshot_every=3)
+    assert reloaded == loaded
+
+
+def test_compact(tmp_path):
+    path = str(tmp_path / "s.journal")
+    journal, messages = reopen(path)
+    for i in range(20):
+        messages.append(user(f"message {i}"))
+        journal.append(messages)
+    journal.snapshot(messages)
+    journal.close()
+
+    before, after = compact_journal(path)
+    assert after < before
+    _, loaded = reopen(path)
+    assert loaded == messages
+
+
+def test_journal_is_private(tmp_path):
+    path = str(tmp_path / "sessions" / "s.journal")
+    journal, messages = reopen(path)
+    messages.append(user("secret"))
+    journal.append(messages)
+    journal.close()
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    assert os.stat(os.path.dirname(path)).st_mode & 0o777 == 0o700
@@ -0,0 +1,62 @@
+import asyncio
+
+from mcp.server.fastmcp import Context, FastMCP
+from pydantic import AnyUrl
+
+from mcp_client import MCPClient
+
+
+def make_server() -> FastMCP:
+    server = FastMCP("test")
+    doc_ids = ["a"]
+
+    @server._mcp_server.subscribe_resource()
+    async def subscribe(uri: AnyUrl) -> None:
+        pass
+
+    @server.resource("docs://documents", mime_type="application/json")
+    def list_docs() -> list[str]:
+        return doc_ids
+
+    @server.tool()
+    async def add_document(ctx: Context, doc_id: str) -> str:
+        doc_ids.append(doc_id)
+        await ctx.session.send_resource_list_changed()
+        return doc_id
+
+    return server
+
+
+def test_list_changed_invalidates_cached_resources():
+    async def run():
+        async with MCPClient("", [], server=make_server()) as client:
+            assert await client.read_resource("docs://documents") == ["a"]
+            assert await client.read_resource("docs://documents") == ["a"]
+            assert client.resource_cache_hits == 1
+
+            await client.call_tool("add_document", {"doc_id": "b"})
+            assert await client.read_resource("docs://documents") == [
+                "a",
+                "b",
+            ]
+
+    asyncio.run(run())
+
+
+def test_list_changed_drops_read_in_flight():
+    async def run():
+        async with MCPClient("", [], server=make_server()) as client:
+            # Started before the notification, so it may see the old list
+            # and must not be cached
+            reading = asyncio.create_task(
+                client.read_resource("docs://documents")
+            )
+            await asyncio.sleep(0)
+            await client.call_tool("add_document", {"doc_id": "b"})
+            await reading
+            assert await client.read_resource("docs://documents") == [
+                "a",
+                "b",
+            ]
+
+    asyncio.run(run())
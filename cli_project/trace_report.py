@@ -0,0 +1,111 @@
+"""Summarizes a trace file written with `main.py --trace FILE`.
+
+    python trace_report.py trace.jsonl
+
+Prints latency percentiles per span name, then a flame-style tree of
+where time went, aggregated over every trace in the file.
+"""
+
+import argparse
+import json
+from collections import defaultdict
+
+BAR_WIDTH = 30
+
+
+def load_spans(path: str) -> list[dict]:
+    spans = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                spans.append(json.loads(line))
+    return spans
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def phase_table(spans: list[dict]) -> str:
+    durations: dict[str, list[float]] = defaultdict(list)
+    for span in spans:
+        durations[span["name"]].append(span["duration_ms"])
+
+    rows = [
+        f"{'phase':<32}{'count':>7}{'p50 ms':>10}{'p90 ms':>10}"
+        f"{'p99 ms':>10}{'max ms':>10}{'total ms':>12}"
+    ]
+    for name, values in sorted(
+        durations.items(), key=lambda item: -sum(item[1])
+    ):
+        rows.append(
+            f"{name:<32}{len(values):>7}"
+            f"{percentile(values, 50):>10.1f}"
+            f"{percentile(values, 90):>10.1f}"
+            f"{percentile(values, 99):>10.1f}"
+            f"{max(values):>10.1f}"
+            f"{sum(values):>12.1f}"
+        )
+    return "\n".join(rows)
+
+
+def flame_summary(spans: list[dict]) -> str:
+    """Total time per call path (root;child;...), drawn as a tree."""
+    by_id = {(s["trace_id"], s["span_id"]): s for s in spans}
+
+    def path(span: dict) -> tuple[str, ...]:
+        names = [span["name"]]
+        parent_id = span["parent_id"]
+        while parent_id is not None:
+            parent = by_id.get((span["trace_id"], parent_id))
+            if parent is None:
+                break
+            names.append(parent["name"])
+            parent_id = parent["parent_id"]
+        return tuple(reversed(names))
+
+    totals: dict[tuple[str, ...], float] = defaultdict(float)
+    for span in spans:
+        totals[path(span)] += span["duration_ms"]
+    if not totals:
+        return ""
+
+    root_total = sum(ms for p, ms in totals.items() if len(p) == 1)
+    rows = []
+
+    def walk(prefix: tuple[str, ...]):
+        children = [
+            p for p in totals if len(p) == len(prefix) + 1 and p[:-1] == prefix
+        ]
+        for child in sorted(children, key=lambda p: -totals[p]):
+            ms = totals[child]
+            share = ms / root_total if root_total else 0
+            bar = "#" * max(int(share * BAR_WIDTH), 1)
+            indent = "  " * (len(child) - 1)
+            rows.append(
+                f"{bar:<{BAR_WIDTH}} {share:>6.1%} {ms:>10.1f} ms  "
+                f"{indent}{child[-1]}"
+            )
+            walk(child)
+
+    walk(())
+    return "\n".join(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("trace_file")
+    args = parser.parse_args()
+
+    spans = load_spans(args.trace_file)
+    print(f"{len(spans)} spans\n")
+    print(phase_table(spans))
+    print()
+    print(flame_summary(spans))
+
+
+if __name__ == "__main__":
+    main()